@@ -0,0 +1,79 @@
+import random
+
+from models import create_schema, db, Question, Category
+
+CATEGORY_NAMES = ['Science', 'Art', 'Geography', 'History', 'Entertainment',
+                  'Sports']
+SUBJECTS = ['lake', 'river', 'painter', 'planet', 'element', 'emperor',
+            'composer', 'mountain', 'novel', 'battle', 'treaty', 'island',
+            'organ', 'protein', 'galaxy', 'sculptor', 'stadium', 'dynasty',
+            'volcano', 'desert', 'poet', 'bridge', 'cathedral', 'symphony']
+QUALIFIERS = ['largest', 'oldest', 'smallest', 'longest', 'first', 'last',
+              'deepest', 'highest', 'most famous', 'least known', 'fastest',
+              'heaviest', 'brightest', 'coldest', 'youngest', 'earliest']
+PLACES = ['Africa', 'Europe', 'Asia', 'South America', 'the Pacific',
+          'ancient Rome', 'the Renaissance', 'the twentieth century',
+          'Scandinavia', 'the Arctic', 'the Andes', 'Mesopotamia']
+ANSWER_WORDS = ['Victoria', 'Amazon', 'Escher', 'Jupiter', 'Helium',
+                'Augustus', 'Bach', 'Everest', 'Ulysses', 'Hastings',
+                'Westphalia', 'Madagascar', 'Liver', 'Keratin', 'Andromeda',
+                'Rodin', 'Maracana', 'Ming', 'Krakatoa', 'Sahara']
+
+
+def generate_categories(count):
+    return [{'id': position + 1,
+             'type': CATEGORY_NAMES[position % len(CATEGORY_NAMES)] +
+             ('' if position < len(CATEGORY_NAMES)
+              else ' {}'.format(position // len(CATEGORY_NAMES) + 1))}
+            for position in range(count)]
+
+
+def generate_questions(count, category_count, seed=0):
+    '''
+    generate_questions(count, category_count, seed)
+        yields ``count`` synthetic question rows. The same seed always
+        produces the same rows, so runs against the same size compare.
+    '''
+    rng = random.Random(seed)
+    for position in range(count):
+        yield {
+            'id': position + 1,
+            'question': 'Question {}: what is the {} {} of {}?'.format(
+                position + 1, rng.choice(QUALIFIERS), rng.choice(SUBJECTS),
+                rng.choice(PLACES)),
+            'answer': '{} {}'.format(rng.choice(ANSWER_WORDS),
+                                     rng.randint(1, 999)),
+            'category': rng.randint(1, category_count),
+            'difficulty': rng.randint(1, 5)
+        }
+
+
+def seed_database(question_count, category_count=len(CATEGORY_NAMES),
+                  seed=0, batch_size=10000):
+    '''
+    seed_database(question_count, category_count, seed)
+        replaces the contents of the bound database with a generated bank.
+        Must run inside an application context.
+    '''
+    create_schema()
+    db.session.execute(Question.__table__.delete())
+    db.session.execute(Category.__table__.delete())
+    db.session.execute(Category.__table__.insert(),
+                       generate_categories(category_count))
+
+    batch = []
+    for row in generate_questions(question_count, category_count, seed):
+        batch.append(row)
+        if len(batch) == batch_size:
+            db.session.execute(Question.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Question.__table__.insert(), batch)
+
+    if db.engine.dialect.name == 'postgresql':
+        # ids were supplied explicitly, move the sequences past them
+        for table in ('questions', 'categories'):
+            db.session.execute(
+                "SELECT setval(pg_get_serial_sequence('{0}', 'id'), "
+                "COALESCE(MAX(id), 1)) FROM {0}".format(table))
+    db.session.commit()
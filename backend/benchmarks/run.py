@@ -0,0 +1,335 @@
+'''
+Endpoint benchmark suite.
+
+Seeds a local database with a generated question bank for every requested
+size, drives create_app() through the Flask test client and reports
+latency percentiles and throughput per route as JSON. Run from the backend
+folder:
+
+    python -m benchmarks.run --sizes 1000 100000 1000000 --output run.json
+    python -m benchmarks.run --sizes 1000 --compare run.json
+
+By default every size gets its own SQLite file in a temporary directory;
+pass --database-url (e.g. postgresql://localhost:5432/trivia_bench) to
+benchmark against a local Postgres instead.
+
+--apps sync async also drives the async read API (flaskr/asgi.py) in
+process, and --concurrency N keeps N requests in flight: N threads for the
+sync app, N tasks on one event loop for the async one.
+
+    python -m benchmarks.run --sizes 100000 --apps sync async --concurrency 32
+
+--storage memory serves the sync app from the in-memory repository instead,
+loaded from a dump of the generated bank, so no database is involved.
+'''
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flaskr import create_app
+from flaskr.memory_repository import write_dump
+from flaskr.testing import ASGIClient
+from models import db
+from .dataset import generate_categories, generate_questions, \
+    seed_database, SUBJECTS, QUALIFIERS
+
+DEFAULT_SIZES = (1000, 100000, 1000000)
+PAGE_SIZE = 10
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    # nearest rank; round(fraction * n + 0.5) picked one sample too high
+    # whenever fraction * n was an odd integer (half rounded to even)
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def route_scenarios(size, category_count, rng):
+    '''
+    Maps a route name to a function issuing one representative request
+    against a bank of ``size`` questions.
+    '''
+    pages = max(size // PAGE_SIZE, 1)
+
+    def quiz_body():
+        return {
+            'previous_questions': rng.sample(
+                range(1, size + 1), min(5, size)),
+            'quiz_category': {'id': rng.randint(0, category_count)}
+        }
+
+    return {
+        'GET /categories': lambda client: client.get('/categories'),
+        'GET /questions?page': lambda client: client.get(
+            '/questions?page={}'.format(rng.randint(1, pages))),
+        'GET /questions?after_id': lambda client: client.get(
+            '/questions?after_id={}'.format(rng.randint(0, size - 1))),
+        'POST /questions/search': lambda client: client.post(
+            '/questions/search', json={'searchTerm': '{} {}'.format(
+                rng.choice(QUALIFIERS), rng.choice(SUBJECTS))}),
+        'GET /categories/<id>/questions': lambda client: client.get(
+            '/categories/{}/questions'.format(
+                rng.randint(1, category_count))),
+        'POST /quizzes': lambda client: client.post(
+            '/quizzes', json=quiz_body()),
+    }
+
+
+def summarize(latencies, errors, requests, elapsed):
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': sum(latencies) / len(latencies) * 1000
+        if latencies else 0.0,
+        'requests_per_second': requests / elapsed if elapsed else 0.0
+    }
+
+
+def measure(client, issue, requests, warmup, concurrency=1):
+    for _ in range(warmup):
+        issue(client)
+
+    latencies = []
+    errors = []
+
+    def timed(_):
+        request_start = time.perf_counter()
+        response = issue(client)
+        latencies.append(time.perf_counter() - request_start)
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(timed, range(requests)))
+    else:
+        for index in range(requests):
+            timed(index)
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, len(errors), requests, elapsed)
+
+
+async def measure_async(client, issue, requests, warmup, concurrency=1):
+    for _ in range(warmup):
+        await issue(client)
+
+    latencies = []
+    errors = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            request_start = time.perf_counter()
+            response = await issue(client)
+            latencies.append(time.perf_counter() - request_start)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, len(errors), requests, elapsed)
+
+
+def run_async_app(database_url, size, args):
+    from flaskr.asgi import create_asgi_app
+
+    async def run():
+        app = create_asgi_app({'DATABASE_PATH': database_url})
+        client = ASGIClient(app)
+        rng = random.Random(args.seed)
+        results = {}
+        try:
+            for route, issue in route_scenarios(
+                    size, args.categories, rng).items():
+                if args.routes and route not in args.routes:
+                    continue
+                results[route] = await measure_async(
+                    client, issue, args.requests, args.warmup,
+                    args.concurrency)
+        finally:
+            await app.shutdown()
+        return results
+
+    return asyncio.run(run())
+
+
+def memory_app(size, args, workdir):
+    dump_path = os.path.join(workdir, 'bench_{}.dump'.format(size))
+    write_dump(dump_path, {
+        'categories': generate_categories(args.categories),
+        'questions': generate_questions(size, args.categories, args.seed)})
+    return create_app({'STORAGE_BACKEND': 'memory',
+                       'STORAGE_DUMP_PATH': dump_path})
+
+
+def benchmark_size(size, args, workdir):
+    database_url = args.database_url or 'sqlite:///{}'.format(
+        os.path.join(workdir, 'bench_{}.db'.format(size)))
+
+    seed_started = time.perf_counter()
+    if args.storage == 'memory':
+        app = memory_app(size, args, workdir)
+    else:
+        app = create_app({'DATABASE_PATH': database_url})
+        with app.app_context():
+            seed_database(size, args.categories, seed=args.seed)
+            db.session.remove()
+    seed_seconds = time.perf_counter() - seed_started
+
+    results = []
+    for app_name in args.apps:
+        if app_name == 'async':
+            measured = run_async_app(database_url, size, args)
+        else:
+            rng = random.Random(args.seed)
+            client = app.test_client()
+            measured = {
+                route: measure(client, issue, args.requests, args.warmup,
+                               args.concurrency)
+                for route, issue in route_scenarios(
+                    size, args.categories, rng).items()
+                if not args.routes or route in args.routes}
+
+        for route, result in measured.items():
+            result.update({'size': size, 'route': route, 'app': app_name,
+                           'storage': args.storage,
+                           'concurrency': args.concurrency})
+            results.append(result)
+            print('{:>9} {:<5} {:<32} p50 {:>9.2f} ms  p95 {:>9.2f} ms  '
+                  'p99 {:>9.2f} ms  {:>9.1f} req/s'.format(
+                      size, app_name, route, result['p50_ms'],
+                      result['p95_ms'], result['p99_ms'],
+                      result['requests_per_second']),
+                  file=sys.stderr)
+
+    # flush buffered play statistics while the database still exists
+    app.extensions['trivia_play_stats'].close()
+    return results, seed_seconds
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    '''
+    Returns the (size, route, baseline p95, current p95) entries whose p95
+    latency regressed by more than ``threshold`` (a fraction).
+    '''
+    def key(entry):
+        return (entry['size'], entry['route'], entry.get('app', 'sync'),
+                entry.get('storage', 'sqlalchemy'))
+
+    previous = {key(entry): entry for entry in baseline['results']}
+    regressions = []
+    for entry in results:
+        before = previous.get(key(entry))
+        if before and entry['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            variant = [name for name in key(entry)[2:]
+                       if name not in ('sync', 'sqlalchemy')]
+            route = entry['route'] if not variant else \
+                '{} ({})'.format(entry['route'], ', '.join(variant))
+            regressions.append((entry['size'], route,
+                                before['p95_ms'], entry['p95_ms']))
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=list(DEFAULT_SIZES))
+    parser.add_argument('--categories', type=int, default=6)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='measured requests per route and size')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--routes', nargs='*',
+                        help='only run these route names')
+    parser.add_argument('--apps', nargs='+', default=['sync'],
+                        choices=['sync', 'async'],
+                        help='async needs SQLAlchemy 1.4+ and aiosqlite '
+                             'or asyncpg')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='requests kept in flight')
+    parser.add_argument('--storage', default='sqlalchemy',
+                        choices=['sqlalchemy', 'memory'],
+                        help='storage backend of the sync app')
+    parser.add_argument('--database-url',
+                        help='benchmark this database instead of SQLite')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--compare', help='baseline JSON report')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='allowed p95 regression against --compare')
+    args = parser.parse_args(argv)
+    if args.storage == 'memory' and 'async' in args.apps:
+        parser.error('the async app needs --storage sqlalchemy')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': args.database_url or 'sqlite',
+            'storage': args.storage,
+            'categories': args.categories,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'seed': args.seed
+        },
+        'seed_seconds': {},
+        'results': []
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            results, seed_seconds = benchmark_size(size, args, workdir)
+            report['seed_seconds'][str(size)] = seed_seconds
+            report['results'].extend(results)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as handle:
+            regressions = compare(report['results'], json.load(handle),
+                                  args.threshold)
+        for size, route, before, after in regressions:
+            print('REGRESSION {} {}: p95 {:.2f} ms -> {:.2f} ms'.format(
+                size, route, before, after), file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
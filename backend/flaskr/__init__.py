@@ -1,31 +1,276 @@
 import os
 import sys
-from flask import Flask, request, abort, jsonify
+from flask import Flask, Response, request, abort, jsonify, \
+    stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from werkzeug.exceptions import HTTPException
-import random
 
-from models import setup_db, Question, Category, db
-
-QUESTIONS_PER_PAGE = 10
-
-
-def paginate_questions(request, selection):
-    page = request.args.get('page', 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-
-    questions = [question.format() for question in selection]
-    return questions[start:end]
+from models import setup_db, database_path, replica_path
+from .bulk import iter_items, insert_questions, json_int
+from .category_cache import CategoryCache
+from .cli import register_commands
+from .export import EXPORT_FORMATS, iter_export
+from .memory_repository import MemoryRepository
+from .metrics import Metrics, render_samples
+from .quiz_index import QuestionIndex
+from .quiz_sessions import QuizSessionStore
+from .reads import QUESTIONS_PER_PAGE, page_of, parse_page, parse_quiz, \
+    parse_search, play, quiz_category_id, record_served, run_draw
+from .repository import STORAGE_BACKENDS, SQLAlchemyRepository
+from .response_cache import ResponseCache
+from .search import SEARCH_MODES, SearchIndex
+from .serialization import get_encoder, json_response
+from .single_flight import SingleFlight
+from .snapshot import SnapshotReader
+from .startup import StartupTimer
+from .stats import StatsBuffer
+from .typeahead import PrefixIndex
+from .versions import DataVersions, GLOBAL, category_scope
+
+TYPEAHEAD_LIMIT = 10
+TYPEAHEAD_MAX_LIMIT = 50
+
+
+def paginate_questions(request, source):
+    """Return one page of questions by id from a repository or snapshot.
+
+    ``?after_id=<id>`` switches to keyset paging (``id > after_id``), which
+    stays cheap no matter how deep into the bank the client is; otherwise
+    the classic ``?page=<n>`` offset paging is used.
+    """
+    try:
+        after_id, offset = parse_page(request.args)
+    except ValueError:
+        return []
+
+    if after_id is not None:
+        return source.page_after(after_id, QUESTIONS_PER_PAGE)
+    return source.page(offset, QUESTIONS_PER_PAGE)
 
 
 def create_app(test_config=None):
     # create and configure the app
+    startup = StartupTimer()
     app = Flask(__name__)
-    setup_db(app)
+    app.config.from_mapping(
+        DATABASE_PATH=database_path,
+        DATABASE_REPLICA_PATH=replica_path,
+        DATABASE_ENGINE_OPTIONS={},
+        QUIZ_SESSION_TTL=60 * 60,
+        QUIZ_SESSION_BACKEND=None,
+        SEARCH_MODE='index',
+        SEARCH_INCLUDE_ANSWERS=False,
+        RESPONSE_CACHE={},
+        BULK_INSERT_BATCH_SIZE=500,
+        SLOW_REQUEST_THRESHOLD_MS=None,
+        WARMUP_ON_START=False,
+        JSON_ENCODER='auto',
+        DATA_VERSION_TTL=1.0,
+        QUESTION_SNAPSHOT_PATH=os.getenv("QUESTION_SNAPSHOT_PATH"),
+        QUESTION_SNAPSHOT_CHECK_INTERVAL=1.0,
+        SINGLE_FLIGHT_MAX_WAIT=2.0,
+        STATS_BUFFER_MAX_QUESTIONS=10000,
+        STATS_FLUSH_INTERVAL=5.0,
+        STORAGE_BACKEND=os.getenv("STORAGE_BACKEND", "sqlalchemy"),
+        STORAGE_DUMP_PATH=os.getenv("STORAGE_DUMP_PATH"),
+    )
+    if test_config is not None:
+        app.config.from_mapping(test_config)
+
+    if app.config["STORAGE_BACKEND"] not in STORAGE_BACKENDS:
+        raise ValueError("unknown storage backend {}".format(
+            app.config["STORAGE_BACKEND"]))
+    if app.config["STORAGE_BACKEND"] == 'memory':
+        if not app.config["STORAGE_DUMP_PATH"]:
+            raise ValueError("the memory storage backend needs "
+                             "STORAGE_DUMP_PATH")
+        with startup.phase('load_dump'):
+            repository = MemoryRepository.from_dump(
+                app.config["STORAGE_DUMP_PATH"])
+    else:
+        with startup.phase('setup_db'):
+            setup_db(app, app.config["DATABASE_PATH"],
+                     engine_options=app.config["DATABASE_ENGINE_OPTIONS"],
+                     replica_path=app.config["DATABASE_REPLICA_PATH"])
+        repository = SQLAlchemyRepository()
+    app.extensions['trivia_repository'] = repository
+
+    app.extensions['trivia_json_encoder'] = get_encoder(
+        app.config["JSON_ENCODER"])
 
     CORS(app)
+    register_commands(app, repository)
+    metrics = Metrics(app)
+
+    category_cache = CategoryCache(repository.categories)
+    question_index = QuestionIndex(
+        lambda: repository.columns('id', 'category', 'difficulty'))
+    quiz_sessions = QuizSessionStore(
+        backend=app.config["QUIZ_SESSION_BACKEND"],
+        ttl=app.config["QUIZ_SESSION_TTL"])
+    search_index = SearchIndex(
+        include_answers=app.config["SEARCH_INCLUDE_ANSWERS"],
+        loader=lambda: repository.columns('id', 'question', 'answer'))
+    prefix_index = PrefixIndex(lambda: repository.columns('id', 'question'))
+    response_cache = ResponseCache(app.config["RESPONSE_CACHE"])
+    single_flight = SingleFlight(app.config["SINGLE_FLIGHT_MAX_WAIT"])
+    def write_stats(counts):
+        with app.app_context():
+            return repository.add_stats(counts)
+
+    play_stats = StatsBuffer(
+        write_stats,
+        max_questions=app.config["STATS_BUFFER_MAX_QUESTIONS"],
+        flush_interval=app.config["STATS_FLUSH_INTERVAL"])
+    app.extensions['trivia_play_stats'] = play_stats
+    data_versions = DataVersions(
+        repository, ttl=app.config["DATA_VERSION_TTL"])
+    snapshots = SnapshotReader(
+        app.config["QUESTION_SNAPSHOT_PATH"],
+        app.config["QUESTION_SNAPSHOT_CHECK_INTERVAL"]) \
+        if app.config["QUESTION_SNAPSHOT_PATH"] else None
+
+    def current_snapshot():
+        """Return the mapped snapshot if it matches the current data."""
+        if snapshots is None:
+            return None
+        snapshot = snapshots.current()
+        if snapshot is None or snapshot.version != data_versions.get(GLOBAL):
+            return None
+        return snapshot
+
+    def questions_added(questions):
+        """Add new questions to every index in one pass.
+
+        The repository has already bumped the data versions with the write.
+        """
+        for question in questions:
+            question_index.add(
+                question.id, question.category, question.difficulty)
+            search_index.add(
+                question.id, question.question, question.answer)
+            prefix_index.add(question.id, question.question)
+        response_cache.invalidate()
+        single_flight.forget()
+
+    def questions_removed(removed):
+        """Drop (id, category) pairs from every index in one pass."""
+        for question_id, _ in removed:
+            question_index.remove(question_id)
+            search_index.remove(question_id)
+            prefix_index.remove(question_id)
+        response_cache.invalidate()
+        single_flight.forget()
+
+    def play_quiz(quiz):
+        """Answer a QuizRequest from the snapshot or the question index."""
+        snapshot = current_snapshot()
+        if snapshot is not None:
+            return run_draw(play(snapshot, quiz),
+                            lambda question_ids, primary:
+                            snapshot.records(question_ids))
+        return run_draw(play(question_index, quiz), repository.records)
+
+    def cache_metrics():
+        category_stats = category_cache.stats()
+        response_stats = response_cache.stats()
+        lines = render_samples(
+            'trivia_cache_hits_total', 'Cache hits.', 'counter',
+            [({"cache": "categories"}, category_stats["hits"])] +
+            [({"cache": "responses", "view": view}, stats["hits"])
+             for view, stats in sorted(response_stats.items())])
+        lines += render_samples(
+            'trivia_cache_misses_total', 'Cache misses.', 'counter',
+            [({"cache": "categories"}, category_stats["misses"])] +
+            [({"cache": "responses", "view": view}, stats["misses"])
+             for view, stats in sorted(response_stats.items())])
+        lines += render_samples(
+            'trivia_single_flight_requests_total',
+            'Read requests by how single-flight served them.', 'counter',
+            [({"view": view, "outcome": outcome}, stats[outcome])
+             for view, stats in sorted(single_flight.stats().items())
+             for outcome in ('executed', 'coalesced', 'expired')])
+        lines += render_samples(
+            'trivia_not_modified_total',
+            'Conditional GETs answered with 304 Not Modified.', 'counter',
+            [({}, data_versions.not_modified)])
+        return lines
+
+    def snapshot_metrics():
+        snapshot = snapshots.current()
+        lines = render_samples(
+            'trivia_snapshot_version',
+            'Data version of the mapped question snapshot, -1 if none.',
+            'gauge', [({}, snapshot.version if snapshot is not None else -1)])
+        lines += render_samples(
+            'trivia_snapshot_swaps_total',
+            'Times a new question snapshot was mapped.', 'counter',
+            [({}, snapshots.swaps)])
+        return lines
+
+    def stats_metrics():
+        buffer_stats = play_stats.stats()
+        lines = render_samples(
+            'trivia_play_stats_pending_questions',
+            'Questions with buffered play statistics.', 'gauge',
+            [({}, buffer_stats["pending_questions"])])
+        lines += render_samples(
+            'trivia_play_stats_flushes_total',
+            'Play statistics flushes by result.', 'counter',
+            [({"result": "ok"}, buffer_stats["flushes"]),
+             ({"result": "failed"}, buffer_stats["failed_flushes"])])
+        lines += render_samples(
+            'trivia_play_stats_dropped_total',
+            'Play events dropped while the buffer was full.', 'counter',
+            [({}, buffer_stats["dropped_events"])])
+        return lines
+
+    metrics.add_collector(cache_metrics)
+    metrics.add_collector(stats_metrics)
+    if snapshots is not None:
+        metrics.add_collector(snapshot_metrics)
+    metrics.add_collector(startup.metrics)
+
+    def warmup():
+        """Preload the hot in-process data before serving traffic."""
+        with app.app_context():
+            data_versions.get(GLOBAL)
+            with startup.phase('warmup_categories'):
+                category_cache.get_map()
+            with startup.phase('warmup_question_index'):
+                question_index.ensure_loaded()
+            with startup.phase('warmup_search_index'):
+                search_index.ensure_loaded()
+            with startup.phase('warmup_prefix_index'):
+                prefix_index.ensure_loaded()
+
+    app.extensions['trivia_warmup'] = warmup
+
+    def caches_outdated():
+        """Drop what was built before another worker's write.
+
+        Which rows that write touched is unknown, so every index reloads
+        in full (O(N)) on its next use; see DataVersions.
+        """
+        category_cache.invalidate()
+        question_index.reset()
+        search_index.reset()
+        prefix_index.reset()
+        response_cache.invalidate()
+        single_flight.forget()
+
+    data_versions.on_change(caches_outdated)
+
+    def category_added(category_id, category_type):
+        category_cache.add(category_id, category_type)
+        response_cache.invalidate()
+        single_flight.forget()
+
+    @app.before_request
+    def check_data_version():
+        # runs the on_change listeners when another worker wrote
+        data_versions.get(GLOBAL)
 
     @app.after_request
     def after_request(response):
@@ -36,20 +281,19 @@ def create_app(test_config=None):
         return response
 
     @app.route('/categories')
+    @data_versions.conditional()
     def get_categories():
         try:
-            categories = Category.query.all()
+            snapshot = current_snapshot()
+            categories = snapshot.categories() if snapshot is not None \
+                else category_cache.get_map()
 
             if len(categories) == 0:
                 abort(422)
 
-            formatted_categories = {}
-            for category in categories:
-                formatted_categories[category.id] = category.type
-
             return jsonify({
                 "success": True,
-                "categories": formatted_categories,
+                "categories": categories,
                 "total_categories": len(categories)
             })
         except Exception as error:
@@ -62,34 +306,47 @@ def create_app(test_config=None):
             body = request.get_json()
 
             category_type = body.get('type', None)
-            category = Category(type=category_type)
-
-            category.insert()
+            category_id = repository.add_category(category_type)
+            category_added(category_id, category_type)
 
             return jsonify({
                 "success": True,
-                "category": category.format()
+                "category": {
+                    "id": category_id,
+                    "type": category_type
+                }
             })
         except Exception as error:
             print(error)
             abort(422)
 
     @app.route('/questions')
+    @data_versions.conditional()
+    @response_cache.cached
+    @single_flight.coalesced
     def get_questions():
         try:
-            selection = Question.query.order_by(Question.id).all()
-            current_questions = paginate_questions(request, selection)
-            categories = Category.query.all()
+            snapshot = current_snapshot()
+            current_questions = paginate_questions(
+                request, snapshot if snapshot is not None else repository)
 
             if len(current_questions) == 0:
                 abort(422)
 
-            return jsonify({
+            if snapshot is not None:
+                categories = snapshot.categories()
+                total_questions = len(snapshot)
+            else:
+                categories = category_cache.get_map()
+                total_questions = repository.count()
+
+            return json_response({
                 "success": True,
                 "questions": current_questions,
-                "total_questions": len(selection),
+                "total_questions": total_questions,
+                "next_after_id": current_questions[-1].id,
                 "current_category": "",
-                "categories": {cat.id: cat.type for cat in categories}
+                "categories": categories
             })
         except Exception as error:
             print(error)
@@ -98,13 +355,12 @@ def create_app(test_config=None):
     @app.route('/questions/<int:question_id>', methods=["DELETE"])
     def delete_question(question_id):
         try:
-            question = Question.query.filter(
-                Question.id == question_id).one_or_none()
+            removed = repository.delete_questions([question_id])
 
-            if question is None:
+            if not removed:
                 abort(404)
 
-            question.delete()
+            questions_removed(removed)
 
             return jsonify({
                 "success": True,
@@ -114,6 +370,50 @@ def create_app(test_config=None):
             print(error)
             abort(422)
 
+    @app.route('/questions/delete', methods=["POST"])
+    def bulk_delete_questions():
+        try:
+            body = request.get_json(silent=True)
+            if not isinstance(body, dict):
+                abort(422)
+            question_ids = body.get('ids', None)
+            category = body.get('category', None)
+            difficulty = body.get('difficulty', None)
+
+            if question_ids is None and category is None and \
+                    difficulty is None:
+                abort(422)
+            if question_ids is not None:
+                if not isinstance(question_ids, list):
+                    abort(422)
+                question_ids = list(dict.fromkeys(
+                    json_int(question_id) for question_id in question_ids))
+            if category is not None:
+                category = json_int(category)
+            if difficulty is not None:
+                difficulty = json_int(difficulty)
+
+            removed = repository.delete_questions(
+                question_ids, category, difficulty)
+            if removed:
+                questions_removed(removed)
+
+            deleted = sorted(question_id for question_id, _ in removed)
+            deleted_ids = set(deleted)
+            not_found = [question_id for question_id in question_ids
+                         if question_id not in deleted_ids] \
+                if question_ids is not None else []
+
+            return jsonify({
+                "success": True,
+                "deleted": deleted,
+                "not_found": not_found,
+                "total_deleted": len(deleted)
+            })
+        except Exception as error:
+            print(error)
+            abort(422)
+
     @app.route('/questions/create', methods=["POST"])
     def create_questions():
         body = request.get_json()
@@ -126,40 +426,95 @@ def create_app(test_config=None):
             if None in [question, answer, difficulty, category]:
                 abort(422)
             else:
-                question = Question(
-                    question=question, answer=answer,
-                    difficulty=difficulty, category=category)
-                question.insert()
-                questions = Question.query.all()
-                formatted_questions = [question.format()
-                                       for question in questions]
-                return jsonify({
+                question = repository.add_question(
+                    question, answer, category, difficulty)
+                questions_added([question])
+
+                response = {
                     "success": True,
-                    "new_question": question.format(),
-                    "questions": formatted_questions,
-                    "total_questions": len(questions)
-                })
+                    "new_question": question.format()
+                }
+                if request.args.get('count', 'false').lower() == 'true':
+                    response["total_questions"] = repository.count()
+                return jsonify(response)
 
         except Exception as error:
             print(error)
             abort(422)
 
+    @app.route('/questions/bulk', methods=["POST"])
+    def bulk_create_questions():
+        try:
+            inserted, errors = insert_questions(
+                repository, iter_items(request), category_cache.get_map(),
+                app.config["BULK_INSERT_BATCH_SIZE"])
+        except Exception as error:
+            print(error)
+            abort(422)
+
+        if inserted:
+            questions_added(inserted)
+
+        return jsonify({
+            "success": True,
+            "inserted": len(inserted),
+            "errors": errors,
+            "total_items": len(inserted) + len(errors)
+        })
+
+    @app.route('/questions/export')
+    def export_questions():
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            abort(422)
+
+        # type=int would turn ?category=abc into None and export everything
+        try:
+            category, difficulty = [
+                None if value is None else int(value)
+                for value in (request.args.get('category', None),
+                              request.args.get('difficulty', None))]
+        except ValueError as error:
+            print(error)
+            abort(422)
+
+        rows = repository.export_rows(
+            category=category, difficulty=difficulty)
+
+        return Response(
+            stream_with_context(iter_export(export_format, rows)),
+            mimetype=EXPORT_FORMATS[export_format])
+
     @app.route('/questions/search', methods=["POST"])
+    @response_cache.cached
+    @single_flight.coalesced
     def search_questions():
-        body = request.get_json()
-        search_term = body.get('searchTerm', None)
-
         try:
-            questions = Question.query.order_by(Question.id).filter(
-                Question.question.ilike('%{}%'.format(search_term))).all()
+            body = request.get_json(silent=True)
+            if not isinstance(body, dict):
+                abort(422)
+            search_term, mode, page = parse_search(
+                body, request.args, app.config["SEARCH_MODE"], SEARCH_MODES)
+            if mode == 'fulltext' and not repository.supports_fulltext():
+                mode = 'index'
 
-            formatted_questions = [question.format()
-                                   for question in questions]
+            ranked = search_index.search(search_term) \
+                if mode == 'index' else None
 
-            return jsonify({
+            if ranked is not None:
+                total = len(ranked)
+                questions = repository.records(page_of(ranked, page))
+            else:
+                total, questions = repository.search(
+                    search_term, 'fulltext' if mode == 'fulltext'
+                    else 'substring',
+                    None if page is None else (page - 1) * QUESTIONS_PER_PAGE,
+                    QUESTIONS_PER_PAGE)
+
+            return json_response({
                 "success": True,
-                "questions": formatted_questions,
-                "total_questions": len(questions),
+                "questions": questions,
+                "total_questions": total,
                 "current_category": "",
             })
 
@@ -167,21 +522,42 @@ def create_app(test_config=None):
             print(error)
             abort(422)
 
+    @app.route('/questions/typeahead')
+    def typeahead_questions():
+        prefix = request.args.get('q', '')
+        limit = min(request.args.get('limit', TYPEAHEAD_LIMIT, type=int),
+                    TYPEAHEAD_MAX_LIMIT)
+
+        try:
+            suggestions = prefix_index.complete(prefix, limit)
+
+            return jsonify({
+                "success": True,
+                "suggestions": [{"id": question_id, "snippet": text}
+                                for question_id, text in suggestions],
+                "query": prefix
+            })
+        except Exception as error:
+            print(error)
+            abort(422)
+
     @app.route('/categories/<string:category_id>/questions', methods=["GET"])
+    @data_versions.conditional(
+        lambda category_id: category_scope(category_id))
+    @response_cache.cached
+    @single_flight.coalesced
     def get_questions_by_categories(category_id):
         try:
-            category = Category.query.get(category_id)
-            questions = Question.query.filter(
-                Question.category == category_id).all()
-            formatted_questions = [question.format() for question in questions]
+            category = category_cache.get(int(category_id))
+            questions = repository.records_in_category(int(category_id))
 
-            if len(formatted_questions) == 0 or category is None:
+            if len(questions) == 0 or category is None:
                 abort(422)
 
-            return jsonify({
+            return json_response({
                 "success": True,
-                "questions": formatted_questions,
-                "total_questions": len(formatted_questions),
+                "questions": questions,
+                "total_questions": len(questions),
                 "current_category": category_id
             })
         except Exception as error:
@@ -190,37 +566,138 @@ def create_app(test_config=None):
 
     @app.route('/quizzes', methods=["POST"])
     def play_quizzes():
+        try:
+            body = request.get_json(silent=True)
+            if not isinstance(body, dict):
+                abort(422)
+
+            payload, served = play_quiz(parse_quiz(body))
+            record_served(play_stats, served)
+            return json_response(payload)
+        except Exception as error:
+            print(error)
+            abort(422)
+
+    @app.route('/questions/<int:question_id>/answer', methods=["POST"])
+    def submit_answer(question_id):
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            abort(422)
+        correct = body.get('correct', None)
+
+        if not isinstance(correct, bool):
+            abort(422)
+
+        play_stats.record(question_id, answered=1, correct=int(correct))
+
+        return jsonify({
+            "success": True,
+            "question_id": question_id,
+            "correct": correct
+        })
+
+    @app.route('/questions/stats')
+    def get_question_stats():
+        page = request.args.get('page', 1, type=int)
+        category = request.args.get('category', None, type=int)
+
+        try:
+            if page < 1:
+                abort(422)
+
+            total, rows = repository.question_stats(
+                category, (page - 1) * QUESTIONS_PER_PAGE, QUESTIONS_PER_PAGE)
+
+            return jsonify({
+                "success": True,
+                "stats": [{
+                    "question_id": question_id,
+                    "category": question_category,
+                    "difficulty": difficulty,
+                    "served": served,
+                    "answered": answered,
+                    "correct": correct
+                } for (question_id, question_category, difficulty, served,
+                       answered, correct) in rows],
+                "total_questions": total
+            })
+        except Exception as error:
+            print(error)
+            abort(422)
+
+    @app.route('/quizzes/sessions', methods=["POST"])
+    def start_quiz_session():
         try:
             body = request.get_json()
-            previous_questions = body.get('previous_questions', None)
             quiz_category = body.get('quiz_category', None)
 
-            if quiz_category is None or previous_questions is None:
+            if quiz_category is None:
                 abort(422)
 
-            else:
+            category = quiz_category_id(quiz_category)
 
-                if quiz_category["id"] == 0:
-                    questions = Question.query.all()
-                else:
-                    questions = Question.query.filter(
-                        Question.category == str(quiz_category["id"])).all()
+            snapshot = current_snapshot()
+            index = snapshot if snapshot is not None else question_index
+            token, total = quiz_sessions.start(index.ids(category), category)
 
-                if len(questions) == len(previous_questions):
-                    question = None
-                else:
-                    question = random.choice(questions)
-                    while question.id in previous_questions:
-                        question = random.choice(questions)
+            return jsonify({
+                "success": True,
+                "session": token,
+                "total_questions": total
+            })
+        except Exception as error:
+            print(error)
+            abort(422)
 
-                return jsonify({
-                    "success": True,
-                    "question": question.format(),
-                })
+    @app.route('/quizzes/sessions/<string:token>/next', methods=["POST"])
+    def next_quiz_question(token):
+        try:
+            question = None
+            while question is None:
+                question_id, remaining = quiz_sessions.next(token)
+                if question_id is None:
+                    break
+                question = next(iter(
+                    repository.records([question_id], primary=True)), None)
+            record_served(play_stats, [question] if question else [])
+        except KeyError:
+            abort(404)
         except Exception as error:
             print(error)
             abort(422)
 
+        return jsonify({
+            "success": True,
+            "question": question.format() if question else None,
+            "remaining": remaining
+        })
+
+    @app.route('/quizzes/sessions/<string:token>', methods=["DELETE"])
+    def end_quiz_session(token):
+        try:
+            quiz_sessions.end(token)
+        except KeyError:
+            abort(404)
+
+        return jsonify({
+            "success": True,
+            "session": token
+        })
+
+    @app.route('/metrics')
+    def get_metrics():
+        return Response(metrics.render(),
+                        mimetype='text/plain; version=0.0.4')
+
+    @app.route('/cache/stats')
+    def get_cache_stats():
+        return jsonify({
+            "success": True,
+            "categories": category_cache.stats(),
+            "responses": response_cache.stats(),
+            "single_flight": single_flight.stats()
+        })
+
     @app.errorhandler(400)
     def bad_request(error):
         return jsonify({
@@ -253,4 +730,9 @@ def create_app(test_config=None):
             "message": "unprocessable entity"
         }), 422
 
+    if app.config["WARMUP_ON_START"]:
+        with startup.phase('warmup'):
+            warmup()
+    startup.finish()
+
     return app
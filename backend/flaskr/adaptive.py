@@ -0,0 +1,34 @@
+QUIZ_MODES = ('random', 'adaptive')
+# consecutive right (or wrong) answers that move the difficulty one level
+ADAPTIVE_STREAK = 2
+
+
+def next_difficulty(levels, current, recent_answers):
+    '''
+    next_difficulty(levels, current, recent_answers)
+        difficulty for the next adaptive question. ``levels`` are the
+        sorted difficulties the category has questions for, ``current`` the
+        difficulty the player is at (None to start in the middle) and
+        ``recent_answers`` the player's answers so far, oldest first, as
+        booleans. The last ADAPTIVE_STREAK answers all right move one
+        level up, all wrong one level down.
+    '''
+    if not levels:
+        return current
+    if current is None:
+        return levels[(len(levels) - 1) // 2]
+
+    position = min(range(len(levels)),
+                   key=lambda index: (abs(levels[index] - current), index))
+    streak = recent_answers[-ADAPTIVE_STREAK:]
+    if len(streak) == ADAPTIVE_STREAK:
+        if all(streak):
+            position = min(position + 1, len(levels) - 1)
+        elif not any(streak):
+            position = max(position - 1, 0)
+    return levels[position]
+
+
+def by_distance(levels, target):
+    '''Levels ordered by distance from target, the easier one first on ties.'''
+    return sorted(levels, key=lambda level: (abs(level - target), level))
@@ -0,0 +1,461 @@
+'''
+Async read API.
+
+An ASGI application serving the read endpoints of create_app() --
+GET /categories, GET /questions, GET /categories/<id>/questions,
+POST /questions/search and POST /quizzes -- from an async SQLAlchemy
+engine, so that one process keeps many requests in flight while they wait
+on the database. It shares the models, the
+in-process quiz and search indexes, the JSON encoding and, through
+flaskr/reads.py, the request parsing, quiz drawing and play statistics of
+the Flask app, and answers with the same bytes. Writes stay on the Flask
+app; the indexes here are reloaded whenever the global data version moves.
+Served quiz questions are counted like the Flask app's, written through a
+sync engine on DATABASE_PATH from the buffer's own thread.
+
+Needs SQLAlchemy 1.4 or newer and an async driver: asyncpg for Postgres,
+aiosqlite for SQLite; requirements-async.txt pins a working set. Serve it
+with any ASGI server, e.g.
+
+    uvicorn --factory flaskr.asgi:create_asgi_app
+'''
+import asyncio
+import json
+import re
+import time
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+try:
+    from sqlalchemy.ext.asyncio import create_async_engine
+except ImportError:  # SQLAlchemy < 1.4 has no asyncio support
+    create_async_engine = None
+
+from models import database_path, replica_path, engine_options_from_env, \
+    QUEUE_POOL_OPTIONS, Question, Category, DataVersion
+from .quiz_index import QuestionIndex
+from .reads import QUESTIONS_PER_PAGE, page_of, parse_page, parse_quiz, \
+    parse_search, play, query_args, record_served, run_draw_async
+from .search import LIKE_ESCAPE, SEARCH_MODES, SearchIndex, \
+    contains_pattern, tokenize
+from .serialization import QUESTION_FIELDS, QuestionRecord, get_encoder
+from .stats import StatsBuffer, upsert_stats
+from .versions import GLOBAL
+
+# sync driver scheme -> async driver scheme
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+ERROR_MESSAGES = {
+    400: "bad request",
+    404: "resource not found",
+    405: "method not allowed",
+    422: "unprocessable entity",
+}
+
+CORS_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow_headers', b'Content-Type, Authorization, true'),
+    (b'access-control-allow-methods',
+     b'GET, POST, PUT, PATCH, DELETE, OPTIONS'),
+]
+
+# what Flask-Cors adds to a preflight answer besides CORS_HEADERS
+PREFLIGHT_HEADERS = [
+    (b'access-control-allow-headers', b'Content-Type, Authorization'),
+]
+
+
+def async_database_url(url):
+    '''Maps a sync database URL onto the matching async driver.'''
+    scheme, separator, rest = url.partition('://')
+    if '+' in scheme or scheme not in ASYNC_DRIVERS:
+        return url
+    return ASYNC_DRIVERS[scheme] + separator + rest
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+def _engine_options(url, config):
+    options = engine_options_from_env()
+    options.update(config["DATABASE_ENGINE_OPTIONS"])
+    if url.startswith('sqlite'):
+        for option in QUEUE_POOL_OPTIONS:
+            options.pop(option, None)
+    return options
+
+
+'''
+AsyncTriviaApp
+    the ASGI callable. The engines are created on the lifespan startup
+    event (or the first request, for servers without lifespan support) and
+    disposed on shutdown, which also flushes the play statistics. Reads go
+    to DATABASE_REPLICA_PATH when set; quiz questions the replica misses
+    are re-read from DATABASE_PATH, as in the Flask app.
+'''
+
+
+class AsyncTriviaApp:
+
+    def __init__(self, config=None):
+        if create_async_engine is None:
+            raise RuntimeError(
+                "the async read API needs SQLAlchemy 1.4 or newer")
+
+        self.config = {
+            "DATABASE_PATH": database_path,
+            "DATABASE_REPLICA_PATH": replica_path,
+            "DATABASE_ENGINE_OPTIONS": {},
+            "SEARCH_MODE": 'index',
+            "SEARCH_INCLUDE_ANSWERS": False,
+            "JSON_ENCODER": 'auto',
+            "DATA_VERSION_TTL": 1.0,
+            "STATS_BUFFER_MAX_QUESTIONS": 10000,
+            "STATS_FLUSH_INTERVAL": 5.0,
+        }
+        self.config.update(config or {})
+        self.encoder = get_encoder(self.config["JSON_ENCODER"])
+        self.engine = None
+        self.primary_engine = None
+        self.stats_engine = None
+        self.play_stats = None
+        self.question_index = QuestionIndex()
+        self.search_index = SearchIndex(
+            include_answers=self.config["SEARCH_INCLUDE_ANSWERS"])
+        self._loaded_version = None
+        self._version = None
+        self._version_expires = 0
+        self._load_lock = None
+
+        # (path pattern, {method: handler}); path groups become arguments
+        self.routes = [
+            (re.compile(r'/categories'), {'GET': self.get_categories}),
+            (re.compile(r'/questions'), {'GET': self.get_questions}),
+            (re.compile(r'/categories/([^/]+)/questions'),
+             {'GET': self.get_questions_by_categories}),
+            (re.compile(r'/questions/search'),
+             {'POST': self.search_questions}),
+            (re.compile(r'/quizzes'), {'POST': self.play_quizzes}),
+        ]
+
+    async def startup(self):
+        if self.engine is not None:
+            return
+        primary = self.config["DATABASE_PATH"]
+        url = async_database_url(primary)
+        self.primary_engine = create_async_engine(
+            url, **_engine_options(url, self.config))
+        self.engine = self.primary_engine
+        if self.config["DATABASE_REPLICA_PATH"]:
+            url = async_database_url(self.config["DATABASE_REPLICA_PATH"])
+            self.engine = create_async_engine(
+                url, **_engine_options(url, self.config))
+        self.stats_engine = create_engine(
+            primary, **_engine_options(primary, self.config))
+        self.play_stats = StatsBuffer(
+            self._write_stats,
+            max_questions=self.config["STATS_BUFFER_MAX_QUESTIONS"],
+            flush_interval=self.config["STATS_FLUSH_INTERVAL"])
+        self._load_lock = asyncio.Lock()
+
+    async def shutdown(self):
+        if self.engine is not None:
+            self.play_stats.close()
+            self.stats_engine.dispose()
+            if self.engine is not self.primary_engine:
+                await self.engine.dispose()
+            await self.primary_engine.dispose()
+            self.engine = self.primary_engine = self.stats_engine = None
+
+    def _write_stats(self, counts):
+        # runs on the buffer's thread, never on the event loop
+        with Session(self.stats_engine) as session:
+            return upsert_stats(counts, session)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        if scope['method'] == 'OPTIONS':
+            # answered before startup(), so a preflight never needs the engine
+            methods = self._methods(scope['path'])
+            if methods:
+                await self._preflight(scope, send, methods)
+            else:
+                await self._respond(send, 404, self.encoder(
+                    self._error(404)), [
+                    (b'content-type', b'application/json')] + CORS_HEADERS)
+            return
+
+        await self.startup()
+        try:
+            handler, path_args = self._route(scope['method'], scope['path'])
+            args = query_args(scope['query_string'].decode('latin-1'))
+            body = await self._read_json(receive) \
+                if scope['method'] == 'POST' else None
+            status, payload = 200, await handler(args, body, *path_args)
+        except HTTPError as error:
+            status, payload = error.status, self._error(error.status)
+        except Exception as error:
+            # like the Flask handlers: a request the handler cannot work
+            # with, e.g. a string page, is unprocessable rather than a 500
+            print(error)
+            status, payload = 422, self._error(422)
+
+        content = self.encoder(payload)
+        await self._respond(send, status, content, [
+            (b'content-type', b'application/json')] + CORS_HEADERS)
+
+    @staticmethod
+    def _error(status):
+        return {
+            "success": False,
+            "error": status,
+            "message": ERROR_MESSAGES[status]
+        }
+
+    @staticmethod
+    async def _respond(send, status, content, headers):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': headers + [
+                (b'content-length', str(len(content)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def _preflight(self, scope, send, methods):
+        # an empty 200 like Flask's automatic OPTIONS answer; the requested
+        # headers are echoed back, as Flask-Cors does
+        requested = dict(scope.get('headers', ())).get(
+            b'access-control-request-headers')
+        headers = [(b'allow', ', '.join(
+            sorted(set(methods) | {'OPTIONS'})).encode())] + CORS_HEADERS
+        if requested:
+            headers.append((b'access-control-allow-headers', requested))
+        else:
+            headers.extend(PREFLIGHT_HEADERS)
+        await self._respond(send, 200, b'', headers)
+
+    def _methods(self, path):
+        # the methods served on ``path``; empty for an unknown path
+        return [method for pattern, methods in self.routes
+                if pattern.fullmatch(path) for method in methods]
+
+    def _route(self, method, path):
+        allowed = False
+        for pattern, methods in self.routes:
+            match = pattern.fullmatch(path)
+            if match is None:
+                continue
+            if method in methods:
+                return methods[method], match.groups()
+            allowed = True
+        raise HTTPError(405 if allowed else 404)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _read_json(receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        try:
+            body = json.loads(b''.join(chunks) or b'null')
+        except ValueError:
+            raise HTTPError(400)
+        if not isinstance(body, dict):
+            raise HTTPError(422)
+        return body
+
+    async def _all(self, statement):
+        async with self.engine.connect() as connection:
+            return (await connection.execute(statement)).all()
+
+    async def _scalar(self, statement):
+        async with self.engine.connect() as connection:
+            return (await connection.execute(statement)).scalar()
+
+    def _question_columns(self):
+        return [getattr(Question, field) for field in QUESTION_FIELDS]
+
+    async def _categories(self):
+        rows = await self._all(
+            select(Category.id, Category.type).order_by(Category.id))
+        return {category_id: category_type
+                for category_id, category_type in rows}
+
+    async def _fetch(self, question_ids, primary=False):
+        # records for the ids in the given order; vanished ids are skipped
+        if not question_ids:
+            return []
+        engine = self.primary_engine if primary else self.engine
+        async with engine.connect() as connection:
+            rows = (await connection.execute(
+                select(*self._question_columns()).where(
+                    Question.id.in_(question_ids)))).all()
+        records = {row.id: QuestionRecord(*row) for row in rows}
+        return [records[question_id] for question_id in question_ids
+                if question_id in records]
+
+    async def _ensure_indexes(self):
+        '''
+        Reloads the quiz and search indexes when the global data version
+        differs from the one they were built at. The version is read at
+        most every DATA_VERSION_TTL seconds.
+        '''
+        now = time.monotonic()
+        if self._version is None or now >= self._version_expires:
+            self._version = await self._scalar(
+                select(DataVersion.version).where(
+                    DataVersion.scope == GLOBAL)) or 0
+            self._version_expires = now + self.config["DATA_VERSION_TTL"]
+
+        if self._loaded_version == self._version:
+            return
+        async with self._load_lock:
+            version = self._version
+            if self._loaded_version == version:
+                return
+            rows = await self._all(select(
+                Question.id, Question.category, Question.difficulty,
+                Question.question, Question.answer))
+            self.question_index.load(
+                [(row[0], row[1], row[2]) for row in rows])
+            self.search_index.load(
+                [(row[0], row[3], row[4]) for row in rows])
+            self._loaded_version = version
+
+    async def get_categories(self, args, body):
+        categories = await self._categories()
+        if len(categories) == 0:
+            raise HTTPError(422)
+        return {
+            "success": True,
+            "categories": categories,
+            "total_categories": len(categories)
+        }
+
+    async def get_questions(self, args, body):
+        query = select(*self._question_columns()).order_by(Question.id)
+        after_id, offset = parse_page(args)
+        if after_id is not None:
+            query = query.where(Question.id > after_id)
+        else:
+            query = query.offset(offset)
+
+        rows = await self._all(query.limit(QUESTIONS_PER_PAGE))
+        questions = [QuestionRecord(*row) for row in rows]
+        if len(questions) == 0:
+            raise HTTPError(422)
+
+        total, categories = await asyncio.gather(
+            self._scalar(select(func.count(Question.id))),
+            self._categories())
+        return {
+            "success": True,
+            "questions": questions,
+            "total_questions": total,
+            "next_after_id": questions[-1].id,
+            "current_category": "",
+            "categories": categories
+        }
+
+    async def get_questions_by_categories(self, args, body, category_id):
+        try:
+            category = int(category_id)
+        except ValueError:
+            raise HTTPError(422)
+        category_type, rows = await asyncio.gather(
+            self._scalar(select(Category.type).where(
+                Category.id == category)),
+            self._all(select(*self._question_columns()).where(
+                Question.category == category)))
+        questions = [QuestionRecord(*row) for row in rows]
+        if len(questions) == 0 or category_type is None:
+            raise HTTPError(422)
+        return {
+            "success": True,
+            "questions": questions,
+            "total_questions": len(questions),
+            "current_category": category_id
+        }
+
+    async def search_questions(self, args, body):
+        search_term, mode, page = parse_search(
+            body, args, self.config["SEARCH_MODE"], SEARCH_MODES)
+        if mode == 'fulltext' and \
+                self.engine.dialect.name != 'postgresql':
+            mode = 'index'
+
+        ranked = None
+        if mode == 'index' and tokenize(search_term):
+            await self._ensure_indexes()
+            ranked = self.search_index.search(search_term)
+
+        if ranked is not None:
+            total = len(ranked)
+            questions = await self._fetch(page_of(ranked, page))
+        else:
+            if mode == 'fulltext':
+                document = func.to_tsvector('english', Question.question)
+                terms = func.plainto_tsquery('english', search_term)
+                condition = document.op('@@')(terms)
+                order = [func.ts_rank(document, terms).desc(), Question.id]
+            else:
+                condition = Question.question.ilike(
+                    contains_pattern(search_term), escape=LIKE_ESCAPE)
+                order = [Question.id]
+            query = select(*self._question_columns()).where(
+                condition).order_by(*order)
+            total = await self._scalar(
+                select(func.count()).select_from(query.subquery()))
+            if page is not None:
+                query = query.offset(
+                    (page - 1) * QUESTIONS_PER_PAGE).limit(
+                    QUESTIONS_PER_PAGE)
+            questions = [QuestionRecord(*row)
+                         for row in await self._all(query)]
+
+        return {
+            "success": True,
+            "questions": questions,
+            "total_questions": total,
+            "current_category": "",
+        }
+
+    async def play_quizzes(self, args, body):
+        quiz = parse_quiz(body)
+        await self._ensure_indexes()
+        payload, served = await run_draw_async(
+            play(self.question_index, quiz), self._fetch)
+        record_served(self.play_stats, served)
+        return payload
+
+
+def create_asgi_app(config=None):
+    return AsyncTriviaApp(config)
@@ -0,0 +1,163 @@
+import json
+
+from sqlalchemy import and_, select
+
+from models import db, Question
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl',
+                    'application/json-seq')
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 5
+# dialects that can return the deleted rows from the DELETE itself
+RETURNING_DIALECTS = ('postgresql',)
+
+
+def json_int(value):
+    '''
+    json_int(value)
+        returns ``value`` if it is a JSON integer. Raises ValueError for
+        anything else, including booleans (an int subclass), floats and
+        numeric strings, which int() would quietly convert.
+    '''
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError("expected an integer, got {!r}".format(value))
+    return value
+
+
+def iter_items(request):
+    '''
+    iter_items(request)
+        yields (index, item) for every question in the request body, either
+        a JSON array or an NDJSON stream read line by line. Lines that are
+        not valid JSON are yielded as (index, ValueError).
+    '''
+    if request.mimetype in NDJSON_MIMETYPES:
+        index = 0
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield index, json.loads(line)
+            except ValueError as error:
+                yield index, error
+            index += 1
+        return
+
+    items = request.get_json()
+    if not isinstance(items, list):
+        raise ValueError("expected a JSON array of questions")
+    for index, item in enumerate(items):
+        yield index, item
+
+
+def validate_question(item, categories):
+    '''
+    Returns (row, None) with a row ready for the questions table, or
+    (None, message) describing why the item was rejected.
+    '''
+    if isinstance(item, ValueError):
+        return None, "invalid JSON: {}".format(item)
+    if not isinstance(item, dict):
+        return None, "expected an object"
+
+    for field in ('question', 'answer'):
+        value = item.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return None, "'{}' must be a non-empty string".format(field)
+
+    try:
+        difficulty = json_int(item.get('difficulty'))
+    except ValueError:
+        return None, "'difficulty' must be an integer"
+    if not MIN_DIFFICULTY <= difficulty <= MAX_DIFFICULTY:
+        return None, "'difficulty' must be between {} and {}".format(
+            MIN_DIFFICULTY, MAX_DIFFICULTY)
+
+    try:
+        category = json_int(item.get('category'))
+    except ValueError:
+        return None, "'category' must be an integer"
+    if category not in categories:
+        return None, "unknown category {}".format(category)
+
+    return {
+        'question': item['question'],
+        'answer': item['answer'],
+        'difficulty': difficulty,
+        'category': category
+    }, None
+
+
+def insert_questions(repository, items, categories, batch_size):
+    '''
+    insert_questions(repository, items, categories, batch_size)
+        validates the (index, item) pairs and stores the valid ones through
+        the repository, one all-or-nothing batch (one transaction in the
+        database) per ``batch_size`` items. Returns the inserted questions
+        as records and a list of {"index", "error"} entries.
+    '''
+    inserted = []
+    errors = []
+    batch = []
+
+    def flush():
+        try:
+            return repository.insert_questions([row for _, row in batch])
+        except Exception as error:
+            message = str(getattr(error, 'orig', error))
+            errors.extend({"index": index, "error": message}
+                          for index, _ in batch)
+            return []
+        finally:
+            del batch[:]
+
+    for index, item in items:
+        row, error = validate_question(item, categories)
+        if error is not None:
+            errors.append({"index": index, "error": error})
+            continue
+        batch.append((index, row))
+        if len(batch) >= batch_size:
+            inserted.extend(flush())
+
+    if batch:
+        inserted.extend(flush())
+
+    return inserted, errors
+
+
+def delete_questions(question_ids=None, category=None, difficulty=None):
+    '''
+    delete_questions(question_ids, category, difficulty)
+        deletes every question matching all of the given criteria in one
+        set-based DELETE. Returns the (id, category) pairs of the deleted
+        rows. On Postgres the rows come back from DELETE ... RETURNING;
+        other databases select them first. Runs in the caller's
+        transaction, which commits or rolls it back.
+    '''
+    table = Question.__table__
+    criteria = []
+    if question_ids is not None:
+        criteria.append(table.c.id.in_(question_ids))
+    if category is not None:
+        criteria.append(table.c.category == category)
+    if difficulty is not None:
+        criteria.append(table.c.difficulty == difficulty)
+    if not criteria:
+        raise ValueError("refusing to delete without ids or a filter")
+    if question_ids is not None and not question_ids:
+        return []
+
+    delete = table.delete().where(and_(*criteria))
+    if db.session.bind.dialect.name in RETURNING_DIALECTS:
+        deleted = db.session.execute(
+            delete.returning(table.c.id, table.c.category)).fetchall()
+    else:
+        deleted = db.session.execute(
+            select([table.c.id, table.c.category]).where(
+                and_(*criteria)).with_for_update()).fetchall()
+        if deleted:
+            db.session.execute(table.delete().where(
+                table.c.id.in_([row[0] for row in deleted])))
+    return [(row[0], row[1]) for row in deleted]
@@ -0,0 +1,51 @@
+import threading
+
+
+'''
+CategoryCache
+    read-through cache of the {id: type} category map. Loaded on the first
+    miss and updated in place by category writes, so the endpoints that
+    need the map stop querying the categories table on every request.
+    Writes made by other workers reach it through invalidate(), which
+    create_app runs when the data version moves.
+    ``loader`` returns the map, e.g. Repository.categories.
+'''
+
+
+class CategoryCache:
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._categories = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_map(self):
+        with self._lock:
+            if self._categories is None:
+                self.misses += 1
+                self._categories = dict(self._loader())
+            else:
+                self.hits += 1
+            return dict(self._categories)
+
+    def get(self, category_id):
+        return self.get_map().get(category_id)
+
+    def add(self, category_id, category_type):
+        with self._lock:
+            if self._categories is not None:
+                self._categories[category_id] = category_type
+
+    def invalidate(self):
+        with self._lock:
+            self._categories = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._categories or ())
+            }
@@ -0,0 +1,39 @@
+import click
+
+from models import create_schema
+from .export import EXPORT_FORMATS, iter_export
+from .snapshot import write_snapshot
+
+
+def register_commands(app, repository):
+
+    @app.cli.command('create-schema')
+    def create_schema_command():
+        """Create missing tables and indexes; run once per deploy."""
+        create_schema()
+        click.echo('schema is up to date')
+
+    @app.cli.command('export-questions')
+    @click.option('--format', 'export_format', default='ndjson',
+                  type=click.Choice(sorted(EXPORT_FORMATS)))
+    @click.option('--category', type=int, default=None)
+    @click.option('--difficulty', type=int, default=None)
+    @click.option('--output', type=click.File('w'), default='-')
+    def export_questions(export_format, category, difficulty, output):
+        """Stream the question bank to a file (stdout by default)."""
+        rows = repository.export_rows(
+            category=category, difficulty=difficulty)
+        for chunk in iter_export(export_format, rows):
+            output.write(chunk)
+
+    @app.cli.command('build-snapshot')
+    @click.option('--output', default=None,
+                  help='Defaults to the QUESTION_SNAPSHOT_PATH setting.')
+    def build_snapshot(output):
+        """Write the question bank snapshot the workers map read-only."""
+        path = output or app.config.get("QUESTION_SNAPSHOT_PATH")
+        if not path:
+            raise click.UsageError(
+                'pass --output or set QUESTION_SNAPSHOT_PATH')
+        version = write_snapshot(path, repository)
+        click.echo('wrote {} at data version {}'.format(path, version))
@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+
+from models import read_session, Question
+
+EXPORT_FIELDS = ('id', 'question', 'answer', 'category', 'difficulty')
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+EXPORT_CHUNK_SIZE = 1000
+
+
+def export_rows(category=None, difficulty=None, chunk_size=EXPORT_CHUNK_SIZE):
+    '''
+    export_rows(category, difficulty)
+        column-only query over the question bank, ordered by id and fetched
+        through a server-side cursor in chunks of ``chunk_size`` rows.
+    '''
+    query = read_session().query(
+        *[getattr(Question, field) for field in EXPORT_FIELDS]).order_by(
+        Question.id)
+    if category is not None:
+        query = query.filter(Question.category == category)
+    if difficulty is not None:
+        query = query.filter(Question.difficulty == difficulty)
+    return query.execution_options(stream_results=True).yield_per(chunk_size)
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(EXPORT_FIELDS, row))) + '\n'
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        value = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return value
+
+    writer.writerow(EXPORT_FIELDS)
+    yield flush()
+    for row in rows:
+        writer.writerow(row)
+        yield flush()
+
+
+def iter_export(export_format, rows):
+    if export_format == 'csv':
+        return iter_csv(rows)
+    if export_format == 'ndjson':
+        return iter_ndjson(rows)
+    raise ValueError("unknown export format {}".format(export_format))
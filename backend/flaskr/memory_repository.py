@@ -0,0 +1,347 @@
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+from sqlalchemy import Integer
+
+from models import Question, Category, QuestionStat, DataVersion
+from .export import EXPORT_CHUNK_SIZE, EXPORT_FIELDS
+from .repository import Repository
+from .serialization import QUESTION_FIELDS, QuestionRecord
+from .stats import STAT_FIELDS
+from .versions import GLOBAL, category_scope
+
+# tables a dump is read for; the others are skipped
+DUMP_TABLES = {table.name: table for table in (
+    Category.__table__, Question.__table__, QuestionStat.__table__,
+    DataVersion.__table__)}
+COPY_HEADER = re.compile(
+    r'^COPY (?:\w+\.)?"?(\w+)"? \(([^)]*)\) FROM stdin;$')
+COPY_END = '\\.'
+COPY_NULL = '\\N'
+COPY_ESCAPE = re.compile(r'\\(.)')
+COPY_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t',
+                'v': '\v'}
+
+
+def _unescape(value):
+    if value == COPY_NULL:
+        return None
+    return COPY_ESCAPE.sub(
+        lambda match: COPY_ESCAPES.get(match.group(1), match.group(1)), value)
+
+
+def _escape(value):
+    if value is None:
+        return COPY_NULL
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace(
+        '\n', '\\n').replace('\r', '\\r')
+
+
+def read_dump(path):
+    '''
+    read_dump(path)
+        parses the COPY blocks of a plain-text pg_dump, such as trivia.psql,
+        into {table: [row dicts]} for the tables in DUMP_TABLES. Other
+        statements are skipped; integer columns are converted.
+    '''
+    tables = {}
+    with open(path, encoding='utf-8') as dump:
+        rows = None
+        for line in dump:
+            line = line.rstrip('\r\n')
+            if rows is None:
+                match = COPY_HEADER.match(line)
+                if match is None:
+                    continue
+                table = DUMP_TABLES.get(match.group(1))
+                columns = [column.strip().strip('"')
+                           for column in match.group(2).split(',')]
+                parsers = [
+                    int if table is not None and column in table.c and
+                    isinstance(table.c[column].type, Integer) else None
+                    for column in columns]
+                rows = tables.setdefault(table.name, []) \
+                    if table is not None else []
+            elif line == COPY_END:
+                rows = None
+            else:
+                values = [_unescape(value) for value in line.split('\t')]
+                rows.append({
+                    column: parse(value) if parse and value is not None
+                    else value
+                    for column, parse, value in zip(columns, parsers, values)})
+    return tables
+
+
+def write_dump(path, tables):
+    '''
+    write_dump(path, tables)
+        writes {table: [row dicts]} as COPY blocks that read_dump() and
+        psql both load.
+    '''
+    with open(path, 'w', encoding='utf-8') as dump:
+        for name, rows in tables.items():
+            columns = [column.name for column in DUMP_TABLES[name].c]
+            dump.write('COPY public.{} ({}) FROM stdin;\n'.format(
+                name, ', '.join(columns)))
+            for row in rows:
+                dump.write('\t'.join(
+                    _escape(row.get(column)) for column in columns) + '\n')
+            dump.write(COPY_END + '\n\n')
+
+
+'''
+MemoryRepository
+    the whole bank in process memory: a dict of id -> QuestionRecord, the
+    sorted id array used for paging, a sorted id array per category and a
+    count per (category, difficulty). Paging bisects into the id array and
+    counting sums the counters, so neither touches the questions. Meant
+    for read-mostly nodes loaded from a dump (see from_dump()); writes
+    stay in this process and are lost on restart.
+'''
+
+
+class MemoryRepository(Repository):
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._questions = {}
+        self._ids = []
+        self._by_category = {}
+        self._counts = Counter()
+        self._categories = {}
+        self._stats = {}
+        self._versions = {}
+        self._last_id = 0
+
+    @classmethod
+    def from_dump(cls, path):
+        repository = cls()
+        repository.load(read_dump(path))
+        return repository
+
+    def load(self, tables):
+        '''Replaces the contents with {table: [row dicts]} rows.'''
+        with self._lock:
+            self._categories = {
+                row['id']: row['type'] for row in sorted(
+                    tables.get('categories', ()), key=lambda row: row['id'])}
+            self._questions = {
+                row['id']: QuestionRecord(
+                    **{field: row.get(field) for field in QUESTION_FIELDS})
+                for row in tables.get('questions', ())}
+            self._ids = sorted(self._questions)
+            self._last_id = self._ids[-1] if self._ids else 0
+            self._by_category = {}
+            self._counts = Counter()
+            for question_id in self._ids:
+                record = self._questions[question_id]
+                self._by_category.setdefault(
+                    record.category, []).append(question_id)
+                self._counts[record.category, record.difficulty] += 1
+            self._stats = {
+                row['question_id']: [row[field] for field in STAT_FIELDS]
+                for row in tables.get('question_stats', ())
+                if row['question_id'] in self._questions}
+            self._versions = {
+                row['scope']: row['version']
+                for row in tables.get('data_versions', ())}
+
+    def categories(self):
+        with self._lock:
+            return dict(self._categories)
+
+    def add_category(self, category_type):
+        with self._lock:
+            category_id = max(self._categories, default=0) + 1
+            self._categories[category_id] = category_type
+            versions = self._bump([GLOBAL])
+        self._bumped(versions)
+        return category_id
+
+    def count(self, category=None, difficulty=None):
+        with self._lock:
+            if category is None and difficulty is None:
+                return len(self._questions)
+            return sum(
+                count for (pool_category, pool_difficulty), count
+                in self._counts.items()
+                if category in (None, pool_category) and
+                difficulty in (None, pool_difficulty))
+
+    def page(self, offset, limit):
+        with self._lock:
+            return [self._questions[question_id]
+                    for question_id in self._ids[offset:offset + limit]]
+
+    def page_after(self, after_id, limit):
+        with self._lock:
+            start = bisect_right(self._ids, after_id)
+            return [self._questions[question_id]
+                    for question_id in self._ids[start:start + limit]]
+
+    def records(self, question_ids, primary=False):
+        with self._lock:
+            return [self._questions[question_id]
+                    for question_id in question_ids
+                    if question_id in self._questions]
+
+    def records_in_category(self, category):
+        with self._lock:
+            return [self._questions[question_id]
+                    for question_id in self._by_category.get(category, ())]
+
+    def columns(self, *fields):
+        with self._lock:
+            return [tuple(getattr(record, field) for field in fields)
+                    for record in self._questions.values()]
+
+    def supports_fulltext(self):
+        return False
+
+    def search(self, term, mode='substring', offset=None, limit=None):
+        if mode != 'substring':
+            raise ValueError("{} search needs a database".format(mode))
+        # the database's ILIKE on contains_pattern(term): a case-insensitive
+        # literal match, '%' and '_' included
+        needle = '{}'.format(term).lower()
+        with self._lock:
+            questions = [
+                self._questions[question_id] for question_id in self._ids
+                if needle in (self._questions[question_id].question or
+                              '').lower()]
+        total = len(questions)
+        if offset is not None:
+            questions = questions[offset:offset + limit]
+        return total, questions
+
+    def add_question(self, question, answer, category, difficulty):
+        with self._lock:
+            record = QuestionRecord(
+                answer=answer, category=int(category),
+                difficulty=int(difficulty), id=self._next_id(),
+                question=question)
+            self._store(record)
+            versions = self._bump([GLOBAL, category_scope(record.category)])
+        self._bumped(versions)
+        return record
+
+    def insert_questions(self, rows):
+        with self._lock:
+            records = [QuestionRecord(
+                answer=row['answer'], category=int(row['category']),
+                difficulty=int(row['difficulty']), id=None,
+                question=row['question']) for row in rows]
+            for record in records:
+                record.id = self._next_id()
+                self._store(record)
+            versions = self._bump({GLOBAL} | {
+                category_scope(record.category) for record in records})
+        self._bumped(versions)
+        return records
+
+    def delete_questions(self, question_ids=None, category=None,
+                         difficulty=None):
+        if question_ids is None and category is None and difficulty is None:
+            raise ValueError("refusing to delete without ids or a filter")
+        with self._lock:
+            if question_ids is not None:
+                candidates = question_ids
+            elif category is not None:
+                candidates = list(self._by_category.get(category, ()))
+            else:
+                candidates = list(self._ids)
+            removed = [
+                (record.id, record.category) for record in (
+                    self._questions.get(question_id)
+                    for question_id in candidates)
+                if record is not None and
+                category in (None, record.category) and
+                difficulty in (None, record.difficulty)]
+            for question_id, _ in removed:
+                self._discard(question_id)
+            versions = self._bump({GLOBAL} | {
+                category_scope(removed_category)
+                for _, removed_category in removed}) if removed else {}
+        if versions:
+            self._bumped(versions)
+        return removed
+
+    def export_rows(self, category=None, difficulty=None,
+                    chunk_size=EXPORT_CHUNK_SIZE):
+        # copy the ids up front so writes during the export cannot break
+        # the iteration; questions deleted meanwhile are skipped
+        with self._lock:
+            question_ids = list(self._ids if category is None
+                                else self._by_category.get(category, ()))
+        for question_id in question_ids:
+            record = self._questions.get(question_id)
+            if record is not None and difficulty in (None, record.difficulty):
+                yield tuple(getattr(record, field) for field in EXPORT_FIELDS)
+
+    def question_stats(self, category=None, offset=0, limit=None):
+        with self._lock:
+            rows = [
+                (question_id, record.category, record.difficulty) +
+                tuple(self._stats[question_id])
+                for question_id, record in (
+                    (question_id, self._questions[question_id])
+                    for question_id in sorted(self._stats))
+                if category in (None, record.category)]
+        end = None if limit is None else offset + limit
+        return len(rows), rows[offset:end]
+
+    def add_stats(self, counts):
+        written = 0
+        with self._lock:
+            for question_id, values in counts.items():
+                if question_id not in self._questions:
+                    continue
+                stored = self._stats.setdefault(question_id, [0, 0, 0])
+                for position, value in enumerate(values):
+                    stored[position] += value
+                written += 1
+        return written
+
+    def version(self, scope):
+        with self._lock:
+            return self._versions.get(scope, 0)
+
+    def bump_versions(self, scopes):
+        with self._lock:
+            versions = self._bump(scopes)
+        self._bumped(versions)
+        return versions
+
+    def _bump(self, scopes):
+        # under the lock, together with the write it versions
+        for scope in scopes:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+        return {scope: self._versions[scope] for scope in scopes}
+
+    def _next_id(self):
+        # like a database sequence, ids of deleted questions are not reused
+        self._last_id += 1
+        return self._last_id
+
+    def _store(self, record):
+        # new ids are always the largest, so the id arrays stay sorted
+        self._questions[record.id] = record
+        self._ids.append(record.id)
+        self._by_category.setdefault(record.category, []).append(record.id)
+        self._counts[record.category, record.difficulty] += 1
+
+    def _discard(self, question_id):
+        record = self._questions.pop(question_id)
+        del self._ids[bisect_left(self._ids, question_id)]
+        pool = self._by_category[record.category]
+        del pool[bisect_left(pool, question_id)]
+        key = (record.category, record.difficulty)
+        self._counts[key] -= 1
+        if not self._counts[key]:
+            del self._counts[key]
+        # question_stats rows cascade with their question
+        self._stats.pop(question_id, None)
@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+logger = logging.getLogger(__name__)
+
+
+'''
+Histogram
+    cumulative Prometheus-style histogram keyed by a label tuple.
+'''
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [
+                [0] * (len(self.buckets) + 1), 0.0]
+        counts = series[0]
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[position] += 1
+                break
+        else:
+            counts[-1] += 1
+        series[1] += value
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} histogram'.format(self.name)]
+        for labels, (counts, total) in sorted(self._series.items()):
+            label_text = ','.join('{}="{}"'.format(name, value) for name, value
+                                  in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                    self.name, label_text, bound, cumulative))
+            lines.append('{}_sum{{{}}} {}'.format(
+                self.name, label_text, total))
+            lines.append('{}_count{{{}}} {}'.format(
+                self.name, label_text, cumulative))
+        return lines
+
+
+'''
+Metrics
+    per-request instrumentation for the app: latency, SQL statement count
+    and time (through SQLAlchemy engine events) and response size, per
+    route. init_app() wires the request hooks; render() produces the
+    Prometheus text exposition served on /metrics. Other components can
+    add their own lines through add_collector().
+'''
+
+
+class Metrics:
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._collectors = []
+        self.slow_request_threshold = None
+        self.latency = Histogram(
+            'trivia_request_duration_seconds',
+            'Request latency in seconds.', ('method', 'route', 'status'),
+            LATENCY_BUCKETS)
+        self.queries = Histogram(
+            'trivia_request_sql_statements',
+            'SQL statements issued per request.', ('method', 'route'),
+            QUERY_BUCKETS)
+        self.db_time = Histogram(
+            'trivia_request_db_seconds',
+            'Time spent in SQL per request in seconds.', ('method', 'route'),
+            LATENCY_BUCKETS)
+        self.response_size = Histogram(
+            'trivia_response_size_bytes',
+            'Response body size in bytes.', ('method', 'route'),
+            SIZE_BUCKETS)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.slow_request_threshold = app.config.get(
+            "SLOW_REQUEST_THRESHOLD_MS")
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        listen_for_sql()
+
+    def add_collector(self, collector):
+        self._collectors.append(collector)
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for histogram in (self.latency, self.queries, self.db_time,
+                              self.response_size):
+                lines.extend(histogram.render())
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+
+    def _after_request(self, response):
+        start = g.get('metrics_start')
+        if start is None:
+            return response
+
+        elapsed = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        method = request.method
+        statements = g.get('sql_statements', 0)
+        sql_seconds = g.get('sql_seconds', 0.0)
+        size = response.calculate_content_length() or 0
+
+        with self._lock:
+            self.latency.observe(
+                (method, route, str(response.status_code)), elapsed)
+            self.queries.observe((method, route), statements)
+            self.db_time.observe((method, route), sql_seconds)
+            self.response_size.observe((method, route), size)
+
+        threshold = self.slow_request_threshold
+        if threshold is not None and elapsed * 1000 >= threshold:
+            logger.warning(
+                "slow request: %s %s took %.1f ms (%d SQL statements, "
+                "%.1f ms in SQL, %d bytes)", method, request.full_path,
+                elapsed * 1000, statements, sql_seconds * 1000, size)
+        return response
+
+
+def render_samples(name, documentation, kind, samples):
+    '''
+    Renders (labels, value) samples of a counter or gauge, labels being a
+    dict of label name to value.
+    '''
+    lines = ['# HELP {} {}'.format(name, documentation),
+             '# TYPE {} {}'.format(name, kind)]
+    for labels, value in samples:
+        label_text = ','.join('{}="{}"'.format(label, labels[label])
+                              for label in sorted(labels))
+        lines.append('{}{{{}}} {}'.format(name, label_text, value)
+                     if label_text else '{} {}'.format(name, value))
+    return lines
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if has_app_context():
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    if has_app_context() and conn.info.get('query_start'):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        if 'sql_statements' in g:
+            g.sql_statements += 1
+            g.sql_seconds += elapsed
+
+
+def listen_for_sql():
+    if not event.contains(Engine, 'before_cursor_execute',
+                          _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
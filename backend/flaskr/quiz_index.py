@@ -0,0 +1,172 @@
+import random
+import threading
+from bisect import insort
+
+
+def _unseen_position(size, seen_positions, rng):
+    # map the r-th unseen slot back to its position in the pool;
+    # seen_positions must be sorted
+    remaining = size - len(seen_positions)
+    if remaining <= 0:
+        return None
+
+    position = rng.randrange(remaining)
+    for seen in seen_positions:
+        if seen > position:
+            break
+        position += 1
+    return position
+
+
+def pick_unseen(pool, seen_positions, rng=random):
+    '''
+    pick_unseen(pool, seen_positions)
+        draws uniformly from the ids in ``pool`` whose positions are not in
+        ``seen_positions``. Work is O(k log k) in the number of seen ids and
+        independent of the size of the pool. Returns None when exhausted.
+    '''
+    position = _unseen_position(len(pool), sorted(seen_positions), rng)
+    return None if position is None else pool[position]
+
+
+def sample_unseen(pool, seen_positions, count, rng=random):
+    '''
+    sample_unseen(pool, seen_positions, count)
+        draws up to ``count`` distinct ids from ``pool`` whose positions are
+        not in ``seen_positions``, without materializing the unseen ids.
+    '''
+    seen = sorted(seen_positions)
+    sample = []
+    for _ in range(count):
+        position = _unseen_position(len(pool), seen, rng)
+        if position is None:
+            break
+        insort(seen, position)
+        sample.append(pool[position])
+    return sample
+
+
+'''
+QuestionIndex
+    in-process index of question ids per category and difficulty, used by
+    the quiz picker so that choosing the next questions never loads the
+    question table. Every question sits in four pools keyed by
+    (category, difficulty), either part being ALL. The index is loaded
+    lazily on first use from ``loader`` (returning (id, category,
+    difficulty) rows) and kept in sync through add() and remove() by the
+    write handlers.
+'''
+
+
+class QuestionIndex:
+    ALL = None
+
+    def __init__(self, loader=None):
+        self._loader = loader
+        self._lock = threading.RLock()
+        self._pools = None
+        self._positions = None
+        self._keys = None
+
+    @staticmethod
+    def key(category, difficulty=ALL):
+        return (None if category is None else int(category),
+                None if difficulty is None else int(difficulty))
+
+    def ensure_loaded(self):
+        with self._lock:
+            if self._pools is None:
+                self.load(self._loader())
+
+    def load(self, rows):
+        '''Replaces the index with (id, category, difficulty) rows.'''
+        with self._lock:
+            self._pools = {self.key(self.ALL): []}
+            self._positions = {self.key(self.ALL): {}}
+            self._keys = {}
+            for question_id, category, difficulty in rows:
+                self._insert(question_id, category, difficulty)
+
+    def reset(self):
+        with self._lock:
+            self._pools = None
+            self._positions = None
+            self._keys = None
+
+    def add(self, question_id, category, difficulty=None):
+        with self._lock:
+            if self._pools is None:
+                return
+            self._insert(question_id, category, difficulty)
+
+    def remove(self, question_id):
+        with self._lock:
+            if self._pools is not None and question_id in self._keys:
+                self._remove(question_id)
+
+    def count(self, category=ALL, difficulty=ALL):
+        self.ensure_loaded()
+        return len(self._pools.get(self.key(category, difficulty), ()))
+
+    def difficulties(self, category=ALL):
+        """Sorted difficulties that have questions in the category."""
+        self.ensure_loaded()
+        category = self.key(category)[0]
+        with self._lock:
+            return sorted(
+                difficulty for (pool_category, difficulty), pool
+                in self._pools.items()
+                if pool_category == category and difficulty is not None
+                and pool)
+
+    def ids(self, category=ALL, difficulty=ALL):
+        self.ensure_loaded()
+        with self._lock:
+            return list(self._pools.get(self.key(category, difficulty), ()))
+
+    def pick(self, category, previous_questions, difficulty=ALL,
+             rng=random):
+        sample = self.sample(category, previous_questions, 1, difficulty, rng)
+        return sample[0] if sample else None
+
+    def sample(self, category, previous_questions, count, difficulty=ALL,
+               rng=random):
+        self.ensure_loaded()
+        key = self.key(category, difficulty)
+        with self._lock:
+            pool = self._pools.get(key, [])
+            positions = self._positions.get(key, {})
+            seen = {positions[question_id]
+                    for question_id in set(previous_questions)
+                    if question_id in positions}
+            return sample_unseen(pool, seen, count, rng)
+
+    def _insert(self, question_id, category, difficulty):
+        if question_id in self._keys:
+            self._remove(question_id)
+        category, difficulty = self.key(category, difficulty)
+        keys = {(self.ALL, self.ALL), (category, self.ALL),
+                (self.ALL, difficulty), (category, difficulty)}
+        self._keys[question_id] = keys
+        for key in keys:
+            self._append(key, question_id)
+
+    def _remove(self, question_id):
+        for key in self._keys.pop(question_id):
+            self._discard(key, question_id)
+
+    def _append(self, key, question_id):
+        positions = self._positions.setdefault(key, {})
+        pool = self._pools.setdefault(key, [])
+        positions[question_id] = len(pool)
+        pool.append(question_id)
+
+    def _discard(self, key, question_id):
+        positions = self._positions[key]
+        pool = self._pools[key]
+        # swap the last id into the hole so removal stays O(1)
+        position = positions.pop(question_id)
+        last = pool.pop()
+        if last != question_id:
+            pool[position] = last
+            positions[last] = position
@@ -0,0 +1,120 @@
+import random
+import secrets
+import threading
+import time
+
+
+'''
+MemorySessionBackend
+    default quiz session storage: a dict of token -> (expires_at, value)
+    with TTL eviction. Any object exposing the same get/set/delete/update
+    methods can be passed in through the QUIZ_SESSION_BACKEND config key
+    instead; update() must be atomic, e.g. a transaction or a script on a
+    shared store, or concurrent turns can deal the same question twice.
+'''
+
+
+class MemorySessionBackend:
+
+    def __init__(self, purge_interval=60, clock=time.monotonic):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._purge_interval = purge_interval
+        self._next_purge = clock() + purge_interval
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            now = self._clock()
+            self._entries[key] = (now + ttl, value)
+            if now >= self._next_purge:
+                self._purge(now)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def update(self, key, function, ttl):
+        '''
+        Atomically replaces the value with function(value)[0], resets its
+        TTL and returns function(value)[1]. Raises KeyError for missing or
+        expired keys.
+        '''
+        with self._lock:
+            now = self._clock()
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                self._entries.pop(key, None)
+                raise KeyError(key)
+            value, result = function(entry[1])
+            self._entries[key] = (now + ttl, value)
+            return result
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _purge(self, now):
+        expired = [key for key, (expires_at, _) in self._entries.items()
+                   if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+        self._next_purge = now + self._purge_interval
+
+
+'''
+QuizSessionStore
+    server-side quiz sessions. start() shuffles the question ids once and
+    stores the deck under a random token; next() pops one id per turn, so
+    a turn costs the same no matter how many questions were answered.
+'''
+
+
+class QuizSessionStore:
+
+    def __init__(self, backend=None, ttl=3600):
+        if backend is not None and not callable(
+                getattr(backend, 'update', None)):
+            raise TypeError(
+                "quiz session backends need an atomic update() method")
+        self.backend = backend if backend is not None \
+            else MemorySessionBackend()
+        self.ttl = ttl
+
+    def start(self, question_ids, category=None, rng=random):
+        deck = list(question_ids)
+        rng.shuffle(deck)
+        token = secrets.token_urlsafe(16)
+        self.backend.set(token, {"category": category, "deck": deck},
+                         self.ttl)
+        return token, len(deck)
+
+    def next(self, token):
+        '''
+        Returns (question_id, remaining) for the session, question_id being
+        None once the deck is empty. Raises KeyError for unknown or expired
+        tokens.
+        '''
+        # one atomic update: a get, pop and set could deal the same
+        # question to two concurrent turns
+        def deal(session):
+            deck = session["deck"]
+            question_id = deck.pop() if deck else None
+            return session, (question_id, len(deck))
+
+        return self.backend.update(token, deal, self.ttl)
+
+    def end(self, token):
+        if self.backend.get(token) is None:
+            raise KeyError(token)
+        self.backend.delete(token)
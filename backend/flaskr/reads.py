@@ -0,0 +1,232 @@
+'''
+Request parsing, quiz drawing and play statistics shared by the Flask app
+(flaskr/__init__.py) and the async read API (flaskr/asgi.py), so that both
+answer a request the same way.
+
+Invalid requests raise ValueError, which both apps turn into a 422. Drawing
+questions needs records loaded from storage, which is a plain call in the
+Flask app and a coroutine in the async one, so draw(), draw_adaptive() and
+play() are generators: they yield (question_ids, primary) whenever they
+need records and are resumed with the loaded records. run_draw() and
+run_draw_async() drive them with a sync or an async loader.
+'''
+from collections import namedtuple
+from urllib.parse import parse_qsl
+
+from .adaptive import QUIZ_MODES, by_distance, next_difficulty
+from .quiz_index import QuestionIndex
+
+QUESTIONS_PER_PAGE = 10
+QUIZ_ROUND_MAX = 50
+
+QuizRequest = namedtuple('QuizRequest', [
+    'category', 'previous_questions', 'difficulty', 'count', 'mode',
+    'recent_answers'])
+
+
+def query_args(query_string):
+    '''
+    Parses a query string into {name: value}, keeping the first of a
+    repeated argument as Flask's request.args.get() does.
+    '''
+    args = {}
+    for name, value in parse_qsl(query_string, keep_blank_values=True):
+        args.setdefault(name, value)
+    return args
+
+
+def int_arg(args, name, default=None):
+    # request.args.get(name, default, type=int)
+    try:
+        return int(args[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def parse_page(args):
+    '''
+    Returns (after_id, offset) for a question listing: ``?after_id=<id>``
+    pages by key (offset None), otherwise ``?page=<n>`` by offset.
+    '''
+    after_id = int_arg(args, 'after_id')
+    if after_id is not None:
+        return after_id, None
+    page = int_arg(args, 'page', 1)
+    if page < 1:
+        raise ValueError("page must be 1 or more")
+    return None, (page - 1) * QUESTIONS_PER_PAGE
+
+
+def parse_search(body, args, default_mode, modes):
+    '''
+    Returns (search_term, mode, page) for POST /questions/search; page is
+    None to return every match.
+    '''
+    search_term = body.get('searchTerm', None)
+    mode = body.get('mode', default_mode)
+    page = body.get('page', int_arg(args, 'page'))
+    if mode not in modes:
+        raise ValueError("unknown search mode {!r}".format(mode))
+    if page is not None and (isinstance(page, bool) or
+                             not isinstance(page, int) or page < 1):
+        raise ValueError("page must be an integer of 1 or more")
+    return search_term, mode, page
+
+
+def page_of(ranked, page):
+    '''The ids of one page of ranked search results, all of them for None.'''
+    if page is None:
+        return ranked
+    start = (page - 1) * QUESTIONS_PER_PAGE
+    return ranked[start:start + QUESTIONS_PER_PAGE]
+
+
+def quiz_category_id(quiz_category):
+    """Return the integer category id of a quiz, ALL for id 0.
+
+    Clients may send the id as a number or, as older clients do, a string.
+    """
+    category_id = int(quiz_category["id"])
+    return QuestionIndex.ALL if category_id == 0 else category_id
+
+
+def parse_quiz(body):
+    '''Validates a POST /quizzes body into a QuizRequest.'''
+    previous_questions = body.get('previous_questions', None)
+    quiz_category = body.get('quiz_category', None)
+    if quiz_category is None or previous_questions is None:
+        raise ValueError("quiz_category and previous_questions are required")
+    if not isinstance(previous_questions, list):
+        raise ValueError("previous_questions must be a list")
+
+    try:
+        category = quiz_category_id(quiz_category)
+        difficulty = body.get('difficulty', None)
+        difficulty = None if difficulty is None else int(difficulty)
+        count = body.get('count', None)
+        count = None if count is None else int(count)
+    except (KeyError, TypeError) as error:
+        raise ValueError("invalid quiz: {}".format(error))
+
+    mode = body.get('mode', 'random')
+    if mode not in QUIZ_MODES:
+        raise ValueError("unknown quiz mode {!r}".format(mode))
+    recent_answers = body.get('recent_answers', [])
+    if mode == 'adaptive':
+        if count is not None or not isinstance(recent_answers, list) or \
+                not all(isinstance(answer, bool)
+                        for answer in recent_answers):
+            raise ValueError("adaptive quizzes take boolean recent_answers")
+    elif count is not None and not 1 <= count <= QUIZ_ROUND_MAX:
+        raise ValueError("count must be between 1 and {}".format(
+            QUIZ_ROUND_MAX))
+
+    return QuizRequest(category, previous_questions, difficulty, count,
+                       mode, recent_answers)
+
+
+def draw(index, category, previous_questions, count, difficulty=None):
+    '''
+    Generator sampling up to ``count`` unseen questions from ``index`` (a
+    QuestionIndex or a snapshot) and loading them; returns the records.
+    Ids a read replica misses are retried on the primary, and ids the
+    primary misses too were deleted behind our back, e.g. by another
+    worker, so they leave the index.
+    '''
+    seen = set(previous_questions)
+    questions = []
+    while len(questions) < count:
+        question_ids = index.sample(
+            category, seen, count - len(questions), difficulty)
+        if not question_ids:
+            break
+        seen.update(question_ids)
+
+        loaded = {question.id: question
+                  for question in (yield question_ids, False)}
+        missing = [question_id for question_id in question_ids
+                   if question_id not in loaded]
+        if missing:
+            # fall back to the primary in case the replica lags
+            loaded.update((question.id, question)
+                          for question in (yield missing, True))
+
+        for question_id in question_ids:
+            if question_id in loaded:
+                questions.append(loaded[question_id])
+            else:
+                index.remove(question_id)
+    return questions
+
+
+def draw_adaptive(index, category, previous_questions, difficulty,
+                  recent_answers):
+    '''
+    Generator picking the next adaptive question, nearest level first;
+    returns (question, difficulty).
+    '''
+    levels = index.difficulties(category)
+    target = next_difficulty(levels, difficulty, recent_answers)
+    for level in by_distance(levels, target):
+        questions = yield from draw(
+            index, category, previous_questions, 1, level)
+        if questions:
+            return questions[0], level
+    return None, target
+
+
+def play(index, quiz):
+    '''
+    Generator answering a QuizRequest; returns (payload, served) with the
+    response payload and the questions served by it.
+    '''
+    if quiz.mode == 'adaptive':
+        question, level = yield from draw_adaptive(
+            index, quiz.category, quiz.previous_questions, quiz.difficulty,
+            quiz.recent_answers)
+        return {
+            "success": True,
+            "question": question,
+            "difficulty": level,
+        }, [question] if question is not None else []
+
+    questions = yield from draw(
+        index, quiz.category, quiz.previous_questions,
+        1 if quiz.count is None else quiz.count, quiz.difficulty)
+    payload = {
+        "success": True,
+        "question": questions[0] if questions else None,
+    }
+    if quiz.count is not None:
+        payload = {
+            "success": True,
+            "questions": questions,
+            "question": payload["question"],
+        }
+    return payload, questions
+
+
+def run_draw(drawing, load):
+    '''Runs a drawing generator with ``load(question_ids, primary)``.'''
+    try:
+        request = next(drawing)
+        while True:
+            request = drawing.send(load(*request))
+    except StopIteration as stop:
+        return stop.value
+
+
+async def run_draw_async(drawing, load):
+    '''Runs a drawing generator with a coroutine ``load``.'''
+    try:
+        request = next(drawing)
+        while True:
+            request = drawing.send(await load(*request))
+    except StopIteration as stop:
+        return stop.value
+
+
+def record_served(play_stats, questions):
+    '''Counts every question a quiz response served.'''
+    for question in questions:
+        play_stats.record(question.id, served=1)
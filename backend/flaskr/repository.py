@@ -0,0 +1,339 @@
+from abc import ABC, abstractmethod
+
+from sqlalchemy.dialects import postgresql
+
+from models import db, read_session, Question, Category, QuestionStat, \
+    DataVersion
+from .bulk import RETURNING_DIALECTS, delete_questions
+from .export import EXPORT_CHUNK_SIZE, export_rows
+from .search import substring_search, fulltext_search
+from .serialization import QUESTION_FIELDS, QuestionRecord, \
+    question_records, to_records
+from .stats import upsert_stats
+from .versions import GLOBAL, category_scope
+
+STORAGE_BACKENDS = ('sqlalchemy', 'memory')
+
+
+'''
+Repository
+    everything the routes and the in-process indexes need from storage.
+    Questions come back as QuestionRecords and id lists keep their order.
+    Every method is abstract, so an implementation missing one fails when
+    it is instantiated rather than when the method is first called.
+
+    The writes bump GLOBAL and the scopes of the categories they touch
+    atomically with the change itself, then hand the new versions to the
+    on_bump() listeners: a write is never visible under its old version.
+    SQLAlchemyRepository keeps the bank in the database;
+    MemoryRepository (flaskr/memory_repository.py) keeps it in
+    process memory.
+'''
+
+
+class Repository(ABC):
+
+    def __init__(self):
+        self._bump_listeners = []
+
+    def on_bump(self, listener):
+        '''Calls ``listener({scope: new version})`` after every bump.'''
+        self._bump_listeners.append(listener)
+
+    def _bumped(self, versions):
+        for listener in self._bump_listeners:
+            listener(versions)
+
+    @abstractmethod
+    def categories(self):
+        '''Returns the {id: type} category map ordered by id.'''
+
+    @abstractmethod
+    def add_category(self, category_type):
+        '''Stores a category, bumping GLOBAL, and returns its id.'''
+
+    @abstractmethod
+    def count(self, category=None, difficulty=None):
+        '''Counts the questions matching the given filters.'''
+
+    @abstractmethod
+    def page(self, offset, limit):
+        '''Returns up to ``limit`` questions by id, skipping ``offset``.'''
+
+    @abstractmethod
+    def page_after(self, after_id, limit):
+        '''Returns up to ``limit`` questions with an id above ``after_id``.'''
+
+    @abstractmethod
+    def records(self, question_ids, primary=False):
+        '''
+        Returns the questions with the given ids in that order, leaving out
+        the missing ones. ``primary`` skips any read replica.
+        '''
+
+    @abstractmethod
+    def records_in_category(self, category):
+        '''Returns the questions of one category ordered by id.'''
+
+    @abstractmethod
+    def columns(self, *fields):
+        '''Returns a tuple of ``fields`` for every question.'''
+
+    @abstractmethod
+    def supports_fulltext(self):
+        '''Whether search() takes mode='fulltext'.'''
+
+    @abstractmethod
+    def search(self, term, mode='substring', offset=None, limit=None):
+        '''
+        Returns (total, questions) matching ``term``; ``mode`` is
+        'substring' or, where supports_fulltext(), 'fulltext'.
+        '''
+
+    @abstractmethod
+    def add_question(self, question, answer, category, difficulty):
+        '''Stores a question and returns it as a record.'''
+
+    @abstractmethod
+    def insert_questions(self, rows):
+        '''
+        Stores question rows (dicts without ids) all or nothing and returns
+        them as records; raises if any of them cannot be stored.
+        '''
+
+    @abstractmethod
+    def delete_questions(self, question_ids=None, category=None,
+                         difficulty=None):
+        '''
+        Deletes the questions matching all given criteria and returns
+        their (id, category) pairs. Raises ValueError without criteria.
+        '''
+
+    @abstractmethod
+    def export_rows(self, category=None, difficulty=None,
+                    chunk_size=EXPORT_CHUNK_SIZE):
+        '''Yields EXPORT_FIELDS tuples ordered by id.'''
+
+    @abstractmethod
+    def question_stats(self, category=None, offset=0, limit=None):
+        '''
+        Returns (total, rows) of (question_id, category, difficulty,
+        served, answered, correct) tuples ordered by question id.
+        '''
+
+    @abstractmethod
+    def add_stats(self, counts):
+        '''
+        Adds {question_id: [served, answered, correct]} to the stored
+        counts, dropping deleted questions; returns the rows written.
+        '''
+
+    @abstractmethod
+    def version(self, scope):
+        '''Returns the scope's data version, 0 if it was never bumped.'''
+
+    @abstractmethod
+    def bump_versions(self, scopes):
+        '''
+        Increments every scope on its own, without a data change, and
+        returns the {scope: new version}.
+        '''
+
+
+'''
+SQLAlchemyRepository
+    the database-backed repository. Reads that tolerate replication lag go
+    through read_session(); writes, version reads and index loads use the
+    primary. Must be used inside an application context.
+'''
+
+
+class SQLAlchemyRepository(Repository):
+
+    def categories(self):
+        return {category.id: category.type
+                for category in Category.query.order_by(Category.id)}
+
+    def add_category(self, category_type):
+        category = Category(type=category_type)
+        try:
+            db.session.add(category)
+            db.session.flush()
+            category_id = category.id
+            versions = self._bump([GLOBAL])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self._bumped(versions)
+        return category_id
+
+    def count(self, category=None, difficulty=None):
+        query = read_session().query(Question)
+        if category is not None:
+            query = query.filter(Question.category == category)
+        if difficulty is not None:
+            query = query.filter(Question.difficulty == difficulty)
+        return query.count()
+
+    def page(self, offset, limit):
+        return to_records(question_records().order_by(Question.id).offset(
+            offset).limit(limit).all())
+
+    def page_after(self, after_id, limit):
+        return to_records(question_records().order_by(Question.id).filter(
+            Question.id > after_id).limit(limit).all())
+
+    def records(self, question_ids, primary=False):
+        if not question_ids:
+            return []
+        questions = {question.id: question
+                     for question in to_records(question_records(
+                         db.session if primary else None).filter(
+                         Question.id.in_(question_ids)).all())}
+        return [questions[question_id] for question_id in question_ids
+                if question_id in questions]
+
+    def records_in_category(self, category):
+        return to_records(question_records().filter(
+            Question.category == category).all())
+
+    def columns(self, *fields):
+        return db.session.query(
+            *[getattr(Question, field) for field in fields]).all()
+
+    def supports_fulltext(self):
+        return read_session().bind.dialect.name == 'postgresql'
+
+    def search(self, term, mode='substring', offset=None, limit=None):
+        query = fulltext_search(term) if mode == 'fulltext' \
+            else substring_search(term)
+        total = query.count()
+        if offset is not None:
+            query = query.offset(offset).limit(limit)
+        return total, to_records(query.all())
+
+    def add_question(self, question, answer, category, difficulty):
+        question = Question(question=question, answer=answer,
+                            difficulty=difficulty, category=category)
+        try:
+            db.session.add(question)
+            db.session.flush()
+            record = QuestionRecord(*[getattr(question, field)
+                                      for field in QUESTION_FIELDS])
+            versions = self._bump([GLOBAL, category_scope(record.category)])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self._bumped(versions)
+        return record
+
+    def insert_questions(self, rows):
+        '''
+        insert_questions(rows)
+            one transaction per call, version bumps included. Postgres
+            inserts all rows with one INSERT ... RETURNING; databases
+            without RETURNING insert them one by one to learn each new id.
+        '''
+        table = Question.__table__
+        try:
+            if db.session.bind.dialect.name in RETURNING_DIALECTS:
+                records = to_records(db.session.execute(
+                    table.insert().values(rows).returning(
+                        *[table.c[field] for field in QUESTION_FIELDS])))
+            else:
+                records = [QuestionRecord(**dict(
+                    row, id=db.session.execute(
+                        table.insert().values(row)).inserted_primary_key[0]))
+                    for row in rows]
+            versions = self._bump({GLOBAL} | {
+                category_scope(record.category) for record in records})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self._bumped(versions)
+        return records
+
+    def delete_questions(self, question_ids=None, category=None,
+                         difficulty=None):
+        try:
+            removed = delete_questions(question_ids, category, difficulty)
+            versions = self._bump({GLOBAL} | {
+                category_scope(removed_category)
+                for _, removed_category in removed}) if removed else {}
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        if versions:
+            self._bumped(versions)
+        return removed
+
+    def export_rows(self, category=None, difficulty=None,
+                    chunk_size=EXPORT_CHUNK_SIZE):
+        return export_rows(category, difficulty, chunk_size)
+
+    def question_stats(self, category=None, offset=0, limit=None):
+        query = read_session().query(
+            QuestionStat.question_id, Question.category,
+            Question.difficulty, QuestionStat.served,
+            QuestionStat.answered, QuestionStat.correct).join(
+            Question, Question.id == QuestionStat.question_id)
+        if category is not None:
+            query = query.filter(Question.category == category)
+        total = query.count()
+        rows = query.order_by(QuestionStat.question_id).offset(
+            offset).limit(limit).all()
+        return total, [tuple(row) for row in rows]
+
+    def add_stats(self, counts):
+        return upsert_stats(counts)
+
+    def version(self, scope):
+        return db.session.query(DataVersion.version).filter(
+            DataVersion.scope == scope).scalar() or 0
+
+    def bump_versions(self, scopes):
+        try:
+            versions = self._bump(scopes)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self._bumped(versions)
+        return versions
+
+    def _bump(self, scopes):
+        '''
+        _bump(scopes)
+            increments the counter of every scope inside the current
+            transaction, so it commits (or rolls back) with the write it
+            versions. Missing rows are created first with an insert that
+            ignores conflicts, so concurrent workers never fail on them; the
+            increments run in SQL, in scope order, so they never lose an
+            update or deadlock. The new values are read back while the
+            updated rows are locked.
+        '''
+        scopes = sorted(set(scopes))
+        table = DataVersion.__table__
+        dialect = db.session.bind.dialect.name
+        rows = [{'scope': scope, 'version': 0} for scope in scopes]
+        if dialect == 'postgresql':
+            db.session.execute(postgresql.insert(table).on_conflict_do_nothing(
+                index_elements=[table.c.scope]), rows)
+        elif dialect == 'sqlite':
+            db.session.execute(table.insert().prefix_with('OR IGNORE'), rows)
+        else:
+            stored = {row[0] for row in db.session.query(
+                DataVersion.scope).filter(DataVersion.scope.in_(scopes))}
+            missing = [row for row in rows if row['scope'] not in stored]
+            if missing:
+                db.session.execute(table.insert(), missing)
+        for scope in scopes:
+            db.session.execute(table.update().where(
+                table.c.scope == scope).values(version=table.c.version + 1))
+        return dict(db.session.query(
+            DataVersion.scope, DataVersion.version).filter(
+            DataVersion.scope.in_(scopes)))
@@ -0,0 +1,135 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, request
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 60
+
+
+'''
+LRUCache
+    bounded mapping with least-recently-used eviction and a per-entry TTL.
+'''
+
+
+class LRUCache:
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl
+            }
+
+
+'''
+ResponseCache
+    opt-in cache of successful JSON responses, one LRUCache per view.
+    Configured through the RESPONSE_CACHE mapping of view name to
+    {"enabled", "max_entries", "ttl"}; views that are not listed, or not
+    enabled, are served uncached. Entries are keyed by path, query string
+    and normalized JSON body, and the whole cache is dropped on writes.
+    A response whose view was still running when the cache was dropped is
+    not stored, since it may predate the write.
+'''
+
+
+class ResponseCache:
+
+    def __init__(self, config=None):
+        self._lock = threading.Lock()
+        # bumped by invalidate()
+        self._generation = 0
+        self._caches = {}
+        for name, options in (config or {}).items():
+            if options.get("enabled", True):
+                self._caches[name] = LRUCache(
+                    max_entries=options.get(
+                        "max_entries", DEFAULT_MAX_ENTRIES),
+                    ttl=options.get("ttl", DEFAULT_TTL))
+
+    def cached(self, view):
+        cache = self._caches.get(view.__name__)
+        if cache is None:
+            return view
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = self.key()
+            entry = cache.get(key)
+            if entry is not None:
+                body, status = entry
+                return current_app.response_class(
+                    body, status=status, mimetype='application/json')
+
+            generation = self._generation
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                with self._lock:
+                    if self._generation == generation:
+                        cache.set(key, (response.get_data(),
+                                        response.status_code))
+            return response
+
+        return wrapper
+
+    @staticmethod
+    def key():
+        body = request.get_json(silent=True)
+        return (
+            request.path,
+            tuple(sorted(request.args.items(multi=True))),
+            json.dumps(body, sort_keys=True) if body is not None else None
+        )
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            for cache in self._caches.values():
+                cache.clear()
+
+    def stats(self):
+        return {name: cache.stats() for name, cache in self._caches.items()}
@@ -0,0 +1,180 @@
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+
+from sqlalchemy import func
+
+from models import Question
+from .serialization import question_records
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+SEARCH_MODES = ('index', 'substring', 'fulltext')
+LIKE_ESCAPE = '\\'
+
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.5
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+'''
+SearchIndex
+    tokenized inverted index over question text (and optionally answers).
+    Every query token has to match a document token exactly or as a prefix;
+    matches are ranked by a tf-idf score where exact hits weigh more than
+    prefix hits. Loaded lazily on first use from ``loader`` (returning (id,
+    question, answer) rows) and kept in sync through add() and remove() by
+    the write handlers.
+'''
+
+
+class SearchIndex:
+
+    def __init__(self, include_answers=False, loader=None):
+        self._loader = loader
+        self.include_answers = include_answers
+        self._lock = threading.RLock()
+        self._postings = None
+        self._vocabulary = None
+        self._documents = None
+
+    def ensure_loaded(self):
+        with self._lock:
+            if self._postings is None:
+                self.load(self._loader())
+
+    def load(self, rows):
+        '''Replaces the index with (id, question, answer) rows.'''
+        with self._lock:
+            self._postings = {}
+            self._vocabulary = []
+            self._documents = {}
+            for question_id, question, answer in rows:
+                self._index(question_id, question, answer)
+
+    def reset(self):
+        with self._lock:
+            self._postings = None
+            self._vocabulary = None
+            self._documents = None
+
+    def add(self, question_id, question, answer=None):
+        with self._lock:
+            if self._postings is not None:
+                self._index(question_id, question, answer)
+
+    def remove(self, question_id):
+        with self._lock:
+            if self._postings is not None:
+                self._unindex(question_id)
+
+    def search(self, term):
+        '''
+        Returns the ids of the questions matching every token of ``term``,
+        best match first. Returns None when ``term`` has no searchable
+        tokens so that callers can fall back to substring matching.
+        '''
+        terms = tokenize(term)
+        if not terms:
+            return None
+
+        self.ensure_loaded()
+        with self._lock:
+            total = len(self._documents) or 1
+            scores = None
+            for query_token in set(terms):
+                token_scores = Counter()
+                for token in self._expand(query_token):
+                    postings = self._postings[token]
+                    weight = EXACT_WEIGHT if token == query_token \
+                        else PREFIX_WEIGHT
+                    idf = math.log(1 + total / len(postings))
+                    for question_id, frequency in postings.items():
+                        token_scores[question_id] += weight * frequency * idf
+
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = Counter({
+                        question_id: score + token_scores[question_id]
+                        for question_id, score in scores.items()
+                        if question_id in token_scores})
+                if not scores:
+                    return []
+
+        return sorted(scores, key=lambda question_id: (
+            -scores[question_id], question_id))
+
+    def _expand(self, prefix):
+        vocabulary = self._vocabulary
+        for position in range(bisect_left(vocabulary, prefix),
+                              len(vocabulary)):
+            token = vocabulary[position]
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def _index(self, question_id, question, answer):
+        if question_id in self._documents:
+            self._unindex(question_id)
+
+        text = question or ''
+        if self.include_answers and answer:
+            text = '{} {}'.format(text, answer)
+        frequencies = Counter(tokenize(text))
+        self._documents[question_id] = frequencies
+
+        for token, frequency in frequencies.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                insort(self._vocabulary, token)
+            postings[question_id] = frequency
+
+    def _unindex(self, question_id):
+        frequencies = self._documents.pop(question_id, None)
+        if frequencies is None:
+            return
+
+        for token in frequencies:
+            postings = self._postings[token]
+            postings.pop(question_id, None)
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+
+
+def contains_pattern(term):
+    '''
+    contains_pattern(term)
+        the ILIKE pattern matching ``term`` anywhere, with the LIKE
+        wildcards in the term escaped so that '%' and '_' match themselves
+        (use with escape=LIKE_ESCAPE).
+    '''
+    return '%{}%'.format('{}'.format(term).replace(
+        LIKE_ESCAPE, LIKE_ESCAPE * 2).replace(
+        '%', LIKE_ESCAPE + '%').replace('_', LIKE_ESCAPE + '_'))
+
+
+def substring_search(term):
+    return question_records().order_by(Question.id).filter(
+        Question.question.ilike(contains_pattern(term), escape=LIKE_ESCAPE))
+
+
+def fulltext_search(term):
+    '''
+    Postgres-only ranked search over to_tsvector(question). Pair it with a
+    GIN index on the same expression to keep it off a sequential scan.
+    '''
+    document = func.to_tsvector('english', Question.question)
+    query = func.plainto_tsquery('english', term)
+    return question_records().filter(
+        document.op('@@')(query)).order_by(
+        func.ts_rank(document, query).desc(), Question.id)
@@ -0,0 +1,144 @@
+import json
+import re
+from dataclasses import dataclass
+
+from flask import current_app, jsonify
+
+from models import read_session, Question
+
+try:
+    import orjson
+except ImportError:  # optional speedup, the stdlib encoder is used instead
+    orjson = None
+
+# Question.format() keys in sorted order, so records serialize exactly like
+# jsonify() would serialize the formatted dicts
+QUESTION_FIELDS = ('answer', 'category', 'difficulty', 'id', 'question')
+
+NON_ASCII = re.compile('[\x7f-\U0010ffff]')
+
+
+'''
+QuestionRecord
+    lightweight, read-only view of a question row built straight from a
+    column-only query, without ORM identity-map bookkeeping.
+'''
+
+
+@dataclass
+class QuestionRecord:
+    __slots__ = QUESTION_FIELDS
+    answer: str
+    category: int
+    difficulty: int
+    id: int
+    question: str
+
+    def format(self):
+        return {
+            'id': self.id,
+            'question': self.question,
+            'answer': self.answer,
+            'category': self.category,
+            'difficulty': self.difficulty
+        }
+
+
+def question_records(session=None):
+    '''
+    question_records(session)
+        column-only query over the question table; wrap the rows it returns
+        with to_records(). Reads go through read_session() by default.
+    '''
+    session = session if session is not None else read_session()
+    return session.query(
+        *[getattr(Question, field) for field in QUESTION_FIELDS])
+
+
+def to_records(rows):
+    return [QuestionRecord(*row) for row in rows]
+
+
+def _builtin(value):
+    # what jsonify() needs: records back to plain dicts
+    if isinstance(value, QuestionRecord):
+        return value.format()
+    if isinstance(value, dict):
+        return {key: _builtin(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_builtin(item) for item in value]
+    return value
+
+
+def _sorted(value):
+    # orjson keeps insertion order: sort dict keys the way json.dumps does,
+    # leaving lists of records (already in key order) untouched
+    if isinstance(value, dict):
+        return {key: _sorted(value[key]) for key in sorted(value)}
+    if isinstance(value, list) and value and \
+            isinstance(value[0], (dict, list)):
+        return [_sorted(item) for item in value]
+    return value
+
+
+def _escape(match):
+    code_point = ord(match.group(0))
+    if code_point > 0xFFFF:
+        code_point -= 0x10000
+        return '\\u{:04x}\\u{:04x}'.format(
+            0xD800 | (code_point >> 10), 0xDC00 | (code_point & 0x3FF))
+    return '\\u{:04x}'.format(code_point)
+
+
+def orjson_dumps(payload):
+    data = orjson.dumps(_sorted(payload), option=orjson.OPT_NON_STR_KEYS)
+    if data.isascii() and b'\x7f' not in data:
+        return data + b'\n'
+    # match json.dumps(ensure_ascii=True)
+    return NON_ASCII.sub(_escape, data.decode('utf-8')).encode() + b'\n'
+
+
+def stdlib_dumps(payload):
+    return (json.dumps(payload, sort_keys=True, separators=(',', ':'),
+                       default=QuestionRecord.format) + '\n').encode()
+
+
+ENCODERS = {
+    'orjson': orjson_dumps,
+    'stdlib': stdlib_dumps
+}
+
+
+def get_encoder(name='auto'):
+    '''
+    Returns a payload -> bytes encoder: 'orjson', 'stdlib', 'auto' (orjson
+    when installed) or any callable with that signature.
+    '''
+    if callable(name):
+        return name
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'stdlib'
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError("JSON_ENCODER is 'orjson' but it is not installed")
+    return ENCODERS[name]
+
+
+def json_response(payload, status=200):
+    '''
+    json_response(payload)
+        jsonify() replacement for list responses: encodes QuestionRecords
+        directly with the configured JSON_ENCODER and produces the same
+        bytes jsonify() would. Falls back to jsonify() whenever the app's
+        JSON settings differ from the compact, sorted, ASCII defaults.
+    '''
+    config = current_app.config
+    if config['JSONIFY_PRETTYPRINT_REGULAR'] or current_app.debug or \
+            not config['JSON_SORT_KEYS'] or not config['JSON_AS_ASCII']:
+        response = jsonify(_builtin(payload))
+        response.status_code = status
+        return response
+
+    encoder = current_app.extensions['trivia_json_encoder']
+    return current_app.response_class(
+        encoder(payload), status=status,
+        mimetype=config['JSONIFY_MIMETYPE'])
@@ -0,0 +1,92 @@
+import threading
+from functools import wraps
+
+from flask import current_app
+
+from .response_cache import ResponseCache
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+'''
+SingleFlight
+    coalesces identical concurrent requests to a read view: the first one
+    (the leader) runs the view, the others wait up to ``max_wait`` seconds
+    and replay its response. Requests are identical when their path, query
+    string and JSON body match, as for the response cache. A waiter whose
+    leader failed or took too long runs the view itself. ``max_wait`` of 0
+    turns coalescing off.
+'''
+
+
+class SingleFlight:
+
+    def __init__(self, max_wait=2.0):
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {}
+
+    def coalesced(self, view):
+        if not self.max_wait:
+            return view
+
+        stats = self._stats.setdefault(view.__name__, {
+            "executed": 0, "coalesced": 0, "expired": 0, "waiting": 0})
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (view.__name__,) + ResponseCache.key()
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    stats["executed"] += 1
+                else:
+                    stats["waiting"] += 1
+
+            if not leader:
+                finished = call.done.wait(self.max_wait)
+                with self._lock:
+                    stats["waiting"] -= 1
+                    if finished and call.result is not None:
+                        stats["coalesced"] += 1
+                    else:
+                        stats["expired"] += 1
+                        stats["executed"] += 1
+                if finished and call.result is not None:
+                    body, status, headers = call.result
+                    return current_app.response_class(
+                        body, status=status, headers=headers)
+                return view(*args, **kwargs)
+
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+                call.result = (response.get_data(), response.status_code,
+                               list(response.headers))
+                return response
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call.done.set()
+
+        return wrapper
+
+    def forget(self):
+        '''
+        Lets requests arriving after a write start a fresh computation
+        instead of joining one that began before it.
+        '''
+        with self._lock:
+            self._calls.clear()
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
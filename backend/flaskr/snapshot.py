@@ -0,0 +1,359 @@
+import logging
+import mmap
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .quiz_index import sample_unseen
+from .serialization import QuestionRecord
+from .versions import GLOBAL
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TRIVSNAP'
+FORMAT_VERSION = 1
+# written in host byte order; a reader on another architecture rejects it
+BYTE_ORDER_MARK = 0x01020304
+# magic, format version, byte order mark, data version, question count,
+# category count, group count, text blob size
+HEADER = struct.Struct('=8sIIqqqqq')
+ALIGNMENT = 8
+# stands in for a NULL category or difficulty in the integer arrays
+MISSING = -1
+
+ALL = None
+
+
+def _padded(size):
+    return size + (-size % ALIGNMENT)
+
+
+def _layout(question_count, category_count, group_count):
+    # (name, typecode, length) of every array, in file order after the header
+    return [
+        ('ids', 'i', question_count),
+        ('categories', 'i', question_count),
+        ('difficulties', 'i', question_count),
+        ('by_id', 'i', question_count),
+        ('text_offsets', 'q', 2 * question_count + 1),
+        ('category_ids', 'i', category_count),
+        ('category_offsets', 'q', category_count + 1),
+        ('groups', 'i', 4 * group_count),
+    ]
+
+
+def _int(value):
+    return MISSING if value is None else int(value)
+
+
+def write_snapshot(path, repository):
+    '''
+    write_snapshot(path, repository)
+        dumps the repository's question bank into the array-backed snapshot
+        format and atomically replaces ``path`` with it, so readers either
+        see the old file or the new one. Rows are ordered by (category,
+        difficulty, id), which makes every quiz pool one contiguous run (or,
+        for a difficulty across all categories, one run per category).
+        Returns the data version the snapshot was taken at.
+    '''
+    # read the version before the rows: a write racing with the dump then
+    # leaves the snapshot tagged with an older version, i.e. stale, never
+    # newer than its contents
+    version = repository.version(GLOBAL)
+    rows = repository.columns(
+        'id', 'category', 'difficulty', 'question', 'answer')
+    categories = list(repository.categories().items())
+
+    rows.sort(key=lambda row: (_int(row[1]), _int(row[2]), row[0]))
+
+    blob = bytearray()
+    text_offsets = array('q', [0])
+    for row in rows:
+        for text in (row[3], row[4]):
+            blob += (text or '').encode('utf-8')
+            text_offsets.append(len(blob))
+    category_offsets = array('q', [len(blob)])
+    for _, category_type in categories:
+        blob += (category_type or '').encode('utf-8')
+        category_offsets.append(len(blob))
+
+    groups = array('i')
+    for start, row in enumerate(rows):
+        key = (_int(row[1]), _int(row[2]))
+        if groups and (groups[-4], groups[-3]) == key:
+            groups[-1] = start + 1
+        else:
+            groups.extend(key + (start, start + 1))
+
+    arrays = {
+        'ids': array('i', [row[0] for row in rows]),
+        'categories': array('i', [_int(row[1]) for row in rows]),
+        'difficulties': array('i', [_int(row[2]) for row in rows]),
+        'by_id': array('i', sorted(range(len(rows)),
+                                   key=lambda position: rows[position][0])),
+        'text_offsets': text_offsets,
+        'category_ids': array('i', [row[0] for row in categories]),
+        'category_offsets': category_offsets,
+        'groups': groups,
+    }
+
+    directory = os.path.dirname(os.path.abspath(path))
+    descriptor, temporary = tempfile.mkstemp(
+        dir=directory, prefix='.snapshot-')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            output.write(HEADER.pack(
+                MAGIC, FORMAT_VERSION, BYTE_ORDER_MARK, version, len(rows),
+                len(categories), len(groups) // 4, len(blob)))
+            output.write(b'\0' * (-HEADER.size % ALIGNMENT))
+            for name, _, _ in _layout(len(rows), len(categories),
+                                      len(groups) // 4):
+                data = arrays[name].tobytes()
+                output.write(data)
+                output.write(b'\0' * (-len(data) % ALIGNMENT))
+            output.write(blob)
+            output.flush()
+            os.fsync(output.fileno())
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return version
+
+
+class _IdsById:
+    # the ids in ascending order, as a sequence bisect can search
+    def __init__(self, ids, by_id):
+        self._ids = ids
+        self._by_id = by_id
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __getitem__(self, index):
+        return self._ids[self._by_id[index]]
+
+
+class _Pool:
+    # ids of one or more contiguous runs of rows, indexable as one list
+    def __init__(self, ids, ranges):
+        self._ids = ids
+        self._ranges = ranges
+        self._starts = []
+        size = 0
+        for start, end in ranges:
+            self._starts.append(size)
+            size += end - start
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, position):
+        index = bisect_right(self._starts, position) - 1
+        return self._ids[self._ranges[index][0] + position -
+                         self._starts[index]]
+
+    def position(self, row):
+        for offset, (start, end) in zip(self._starts, self._ranges):
+            if start <= row < end:
+                return offset + row - start
+        return None
+
+
+'''
+QuestionSnapshot
+    read-only view over a mapped snapshot file. The integer arrays are
+    memoryviews straight into the mapping, so every worker on a host shares
+    one copy of them through the page cache; only the text of the questions
+    actually returned is decoded. Mirrors the QuestionIndex lookups used by
+    the quiz picker, plus paging and the category map.
+'''
+
+
+class QuestionSnapshot:
+
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        (magic, format_version, byte_order_mark, self.version,
+         question_count, category_count, group_count,
+         blob_size) = HEADER.unpack_from(view)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError("not a question snapshot")
+        if byte_order_mark != BYTE_ORDER_MARK:
+            raise ValueError("snapshot was written on another architecture")
+
+        offset = _padded(HEADER.size)
+        arrays = {}
+        for name, typecode, length in _layout(question_count, category_count,
+                                              group_count):
+            size = length * array(typecode).itemsize
+            arrays[name] = view[offset:offset + size].cast(typecode)
+            offset += _padded(size)
+        self._blob = view[offset:offset + blob_size]
+
+        self._ids = arrays['ids']
+        self._categories = arrays['categories']
+        self._difficulties = arrays['difficulties']
+        self._by_id = arrays['by_id']
+        self._text_offsets = arrays['text_offsets']
+        self._category_ids = arrays['category_ids']
+        self._category_offsets = arrays['category_offsets']
+        self._sorted_ids = _IdsById(self._ids, self._by_id)
+
+        # one entry per (category, difficulty) run: small next to the bank
+        self._ranges = {(ALL, ALL): [(0, question_count)]}
+        groups = arrays['groups']
+        for index in range(0, len(groups), 4):
+            category, difficulty, start, end = groups[index:index + 4]
+            category = None if category == MISSING else category
+            difficulty = None if difficulty == MISSING else difficulty
+            keys = {(ALL, difficulty)}
+            if category is not None:
+                keys |= {(category, difficulty), (category, ALL)}
+            keys.discard((ALL, ALL))
+            for key in keys:
+                ranges = self._ranges.setdefault(key, [])
+                if ranges and ranges[-1][1] == start:
+                    ranges[-1] = (ranges[-1][0], end)
+                else:
+                    ranges.append((start, end))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _text(self, index):
+        return str(self._blob[self._text_offsets[index]:
+                              self._text_offsets[index + 1]], 'utf-8')
+
+    def _row(self, question_id):
+        index = bisect_left(self._sorted_ids, question_id)
+        if index < len(self._sorted_ids) and \
+                self._sorted_ids[index] == question_id:
+            return self._by_id[index]
+        return None
+
+    def _record(self, row):
+        category = self._categories[row]
+        difficulty = self._difficulties[row]
+        return QuestionRecord(
+            answer=self._text(2 * row + 1),
+            category=None if category == MISSING else category,
+            difficulty=None if difficulty == MISSING else difficulty,
+            id=self._ids[row],
+            question=self._text(2 * row))
+
+    def _pool(self, category, difficulty):
+        key = (None if category is None else int(category),
+               None if difficulty is None else int(difficulty))
+        return _Pool(self._ids, self._ranges.get(key, []))
+
+    def categories(self):
+        offsets = self._category_offsets
+        return {self._category_ids[index]: str(
+            self._blob[offsets[index]:offsets[index + 1]], 'utf-8')
+            for index in range(len(self._category_ids))}
+
+    def count(self, category=ALL, difficulty=ALL):
+        return len(self._pool(category, difficulty))
+
+    def difficulties(self, category=ALL):
+        category = None if category is None else int(category)
+        return sorted(difficulty for (run_category, difficulty), ranges
+                      in self._ranges.items()
+                      if run_category == category and difficulty is not None
+                      and ranges)
+
+    def ids(self, category=ALL, difficulty=ALL):
+        pool = self._pool(category, difficulty)
+        return [pool[position] for position in range(len(pool))]
+
+    def records(self, question_ids):
+        rows = (self._row(question_id) for question_id in question_ids)
+        return [self._record(row) for row in rows if row is not None]
+
+    def page(self, offset, limit):
+        '''Returns up to ``limit`` records in id order starting at offset.'''
+        return [self._record(self._by_id[index]) for index in
+                range(offset, min(offset + limit, len(self._by_id)))]
+
+    def page_after(self, after_id, limit):
+        return self.page(bisect_right(self._sorted_ids, after_id), limit)
+
+    def sample(self, category, previous_questions, count, difficulty=ALL,
+               rng=random):
+        pool = self._pool(category, difficulty)
+        seen = set()
+        for question_id in set(previous_questions):
+            row = self._row(question_id)
+            position = pool.position(row) if row is not None else None
+            if position is not None:
+                seen.add(position)
+        return sample_unseen(pool, seen, count, rng)
+
+
+'''
+SnapshotReader
+    maps the snapshot at ``path`` read-only and swaps in the new file when
+    the CLI replaces it. The file is stat()ed at most every
+    ``check_interval`` seconds; a reader whose file is missing or invalid
+    returns None so callers fall back to the database.
+'''
+
+
+class SnapshotReader:
+
+    def __init__(self, path, check_interval=1.0, clock=time.monotonic):
+        self.path = path
+        self.check_interval = check_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._identity = None
+        self._next_check = 0
+        self.swaps = 0
+
+    def current(self):
+        now = self._clock()
+        if now < self._next_check:
+            return self._snapshot
+
+        with self._lock:
+            if now >= self._next_check:
+                self._next_check = now + self.check_interval
+                self._refresh()
+            return self._snapshot
+
+    def _refresh(self):
+        try:
+            status = os.stat(self.path)
+        except OSError:
+            self._snapshot, self._identity = None, None
+            return
+
+        identity = (status.st_ino, status.st_mtime_ns, status.st_size)
+        if identity == self._identity:
+            return
+
+        try:
+            with open(self.path, 'rb') as source:
+                mapping = mmap.mmap(source.fileno(), 0,
+                                    access=mmap.ACCESS_READ)
+            snapshot = QuestionSnapshot(mapping)
+        except (OSError, ValueError, struct.error) as error:
+            logger.warning("ignoring question snapshot %s: %s",
+                           self.path, error)
+            self._snapshot, self._identity = None, identity
+            return
+
+        # the previous mapping is released once in-flight requests drop it
+        self._snapshot, self._identity = snapshot, identity
+        self.swaps += 1
+        logger.info("mapped question snapshot %s at data version %d",
+                    self.path, snapshot.version)
@@ -0,0 +1,43 @@
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .metrics import render_samples
+
+logger = logging.getLogger(__name__)
+
+
+'''
+StartupTimer
+    records how long each startup phase (app creation, database setup,
+    warmup steps) took, so slow boots show up in the log and on /metrics.
+'''
+
+
+class StartupTimer:
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+            logger.info("startup phase %s took %.1f ms", name,
+                        self.phases[name] * 1000)
+
+    def finish(self):
+        self.phases['total'] = time.perf_counter() - self._started
+        logger.info("app started in %.1f ms", self.phases['total'] * 1000)
+
+    def metrics(self):
+        return render_samples(
+            'trivia_startup_phase_seconds',
+            'Time spent in each startup phase in seconds.', 'gauge',
+            [({"phase": name}, seconds)
+             for name, seconds in self.phases.items()])
@@ -0,0 +1,191 @@
+import atexit
+import logging
+import threading
+import weakref
+
+from sqlalchemy import bindparam
+from sqlalchemy.dialects import postgresql
+
+from models import db, Question, QuestionStat
+
+logger = logging.getLogger(__name__)
+
+STAT_FIELDS = ('served', 'answered', 'correct')
+
+# started buffers, flushed once more when the process exits; closed or
+# collected buffers drop out, so creating apps leaks nothing
+_open_buffers = weakref.WeakSet()
+
+
+@atexit.register
+def _close_buffers():
+    for buffer in list(_open_buffers):
+        buffer.close()
+
+
+def upsert_stats(counts, session=None):
+    '''
+    upsert_stats(counts, session)
+        adds ``counts`` ({question_id: [served, answered, correct]}) to the
+        question_stats table in one transaction of ``session`` (the app's
+        db.session by default). Counts for questions that no longer exist
+        are dropped. Postgres gets one INSERT ... ON CONFLICT DO UPDATE;
+        other databases an UPDATE for the existing rows and an INSERT for
+        the new ones, each as one executemany.
+    '''
+    session = session if session is not None else db.session
+    existing = {row[0] for row in session.query(Question.id).filter(
+        Question.id.in_(list(counts)))}
+    rows = [dict(zip(STAT_FIELDS, counts[question_id]),
+                 question_id=question_id)
+            for question_id in sorted(existing)]
+    if not rows:
+        return 0
+
+    table = QuestionStat.__table__
+    try:
+        if session.bind.dialect.name == 'postgresql':
+            insert = postgresql.insert(table)
+            session.execute(insert.on_conflict_do_update(
+                index_elements=[table.c.question_id],
+                set_={field: table.c[field] + insert.excluded[field]
+                      for field in STAT_FIELDS}), rows)
+        else:
+            stored = {row[0] for row in session.query(
+                QuestionStat.question_id).filter(
+                QuestionStat.question_id.in_(list(existing)))}
+            updates = [row for row in rows if row['question_id'] in stored]
+            inserts = [row for row in rows
+                       if row['question_id'] not in stored]
+            if updates:
+                session.execute(
+                    table.update().where(
+                        table.c.question_id == bindparam('stat_id')).values(
+                        {field: table.c[field] + bindparam('add_' + field)
+                         for field in STAT_FIELDS}),
+                    [dict({'add_' + field: row[field]
+                           for field in STAT_FIELDS},
+                          stat_id=row['question_id']) for row in updates])
+            if inserts:
+                session.execute(table.insert(), inserts)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    return len(rows)
+
+
+'''
+StatsBuffer
+    write-behind buffer of quiz play events. ``write(counts)`` stores a
+    batch, e.g. through Repository.add_stats(), and returns the rows
+    written. record() only adds to
+    in-memory counters aggregated per question and never writes itself.
+    A daemon thread flushes every ``flush_interval`` seconds (0: only when
+    woken), and the buffer is flushed once more when the process exits.
+    Memory is bounded by ``max_questions`` distinct questions: reaching it
+    wakes the thread, and events for further new questions are dropped and
+    counted until the flush has run. A failed flush is retried once, e.g.
+    after two workers raced to insert the same new stats row, before the
+    batch is dropped.
+'''
+
+
+class StatsBuffer:
+
+    def __init__(self, write, max_questions=10000, flush_interval=5.0):
+        self.write = write
+        self.max_questions = max_questions
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counts = {}
+        self._stopped = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._started = False
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.dropped_events = 0
+
+    def record(self, question_id, served=0, answered=0, correct=0):
+        with self._lock:
+            counts = self._counts.get(question_id)
+            if counts is None and len(self._counts) < self.max_questions:
+                counts = self._counts[question_id] = [0, 0, 0]
+            if counts is None:
+                self.dropped_events += 1
+            else:
+                counts[0] += served
+                counts[1] += answered
+                counts[2] += correct
+            full = len(self._counts) >= self.max_questions
+        self._start()
+        if full:
+            # the request thread never waits for the database
+            self._wake.set()
+
+    def flush(self):
+        '''Writes the buffered counts; returns the number of rows written.'''
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts = self._counts, {}
+            if not counts:
+                return 0
+            for attempt in range(2):
+                try:
+                    written = self.write(counts)
+                    break
+                except Exception as error:
+                    if not attempt:
+                        # the write rolled back as a whole; run it again
+                        continue
+                    # keep memory bounded: the failed batch is dropped
+                    self.failed_flushes += 1
+                    logger.warning("dropped stats for %d questions: %s",
+                                   len(counts), error)
+                    return 0
+            self.flushes += 1
+            self.flushed_rows += written
+            return written
+
+    def close(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(self.flush_interval or None)
+        self.flush()
+        _open_buffers.discard(self)
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._counts)
+        return {
+            "pending_questions": pending,
+            "max_questions": self.max_questions,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failed_flushes": self.failed_flushes,
+            "dropped_events": self.dropped_events
+        }
+
+    def _start(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._thread = threading.Thread(
+                target=self._run, name='trivia-stats-flush', daemon=True)
+            self._thread.start()
+        _open_buffers.add(self)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval or None)
+            self._wake.clear()
+            if self._stopped.is_set():
+                return
+            self.flush()
@@ -0,0 +1,59 @@
+'''
+Test helpers shared by the test suite and the benchmarks.
+'''
+import json
+from urllib.parse import urlsplit
+
+
+class ASGIResponse:
+
+    def __init__(self, status_code, data, headers=()):
+        self.status_code = status_code
+        self.data = data
+        self.headers = {name.decode('latin-1'): value.decode('latin-1')
+                        for name, value in headers}
+
+
+class ASGIClient:
+    '''
+    Minimal in-process client for an ASGI app with the get()/post(json=)
+    surface of the Flask test client, returning awaitables.
+    '''
+
+    def __init__(self, app):
+        self.app = app
+
+    def get(self, url):
+        return self.request('GET', url)
+
+    def post(self, url, json=None):
+        return self.request('POST', url, json)
+
+    def options(self, url, headers=()):
+        return self.request('OPTIONS', url, headers=headers)
+
+    async def request(self, method, url, body=None, headers=()):
+        parts = urlsplit(url)
+        payload = b'' if body is None else json.dumps(body).encode()
+        scope = {'type': 'http', 'method': method, 'path': parts.path,
+                 'query_string': parts.query.encode(), 'headers': [
+                     (b'content-type', b'application/json')] + [
+                     (name.lower().encode('latin-1'),
+                      value.encode('latin-1'))
+                     for name, value in headers]}
+        messages = [{'type': 'http.request', 'body': payload,
+                     'more_body': False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0) if messages else {
+                'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        await self.app(scope, receive, send)
+        return ASGIResponse(sent[0]['status'],
+                            b''.join(message.get('body', b'')
+                                     for message in sent[1:]),
+                            sent[0].get('headers', ()))
@@ -0,0 +1,107 @@
+import threading
+from bisect import bisect_left, insort
+
+from .search import tokenize
+
+SNIPPET_LENGTH = 80
+
+
+def snippet(text, length=SNIPPET_LENGTH):
+    text = text or ''
+    if len(text) <= length:
+        return text
+    return text[:length - 1].rstrip() + '…'
+
+
+'''
+PrefixIndex
+    sorted array of (token, question_id) pairs over question text, used to
+    answer per-keystroke typeahead queries with a bisect instead of SQL.
+    Loaded lazily on first use from ``loader`` (returning (id, question)
+    rows) and kept in sync through add() and remove() by the write handlers.
+'''
+
+
+class PrefixIndex:
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.RLock()
+        self._entries = None
+        self._tokens = None
+        self._snippets = None
+
+    def ensure_loaded(self):
+        with self._lock:
+            if self._entries is None:
+                rows = self._loader()
+                self._tokens = {}
+                self._snippets = {}
+                for question_id, question in rows:
+                    self._tokens[question_id] = frozenset(tokenize(question))
+                    self._snippets[question_id] = snippet(question)
+                self._entries = sorted(
+                    (token, question_id)
+                    for question_id, tokens in self._tokens.items()
+                    for token in tokens)
+
+    def reset(self):
+        with self._lock:
+            self._entries = None
+            self._tokens = None
+            self._snippets = None
+
+    def add(self, question_id, question):
+        with self._lock:
+            if self._entries is None:
+                return
+            self._remove(question_id)
+            tokens = frozenset(tokenize(question))
+            self._tokens[question_id] = tokens
+            self._snippets[question_id] = snippet(question)
+            for token in tokens:
+                insort(self._entries, (token, question_id))
+
+    def remove(self, question_id):
+        with self._lock:
+            if self._entries is not None:
+                self._remove(question_id)
+
+    def complete(self, text, limit=10):
+        '''
+        Returns up to ``limit`` (question_id, snippet) pairs for questions
+        containing every complete word of ``text`` and a word starting with
+        its last, possibly partial, word.
+        '''
+        words = tokenize(text)
+        if not words or limit < 1:
+            return []
+
+        self.ensure_loaded()
+        prefix, required = words[-1], set(words[:-1])
+        results = []
+        seen = set()
+        with self._lock:
+            entries = self._entries
+            for position in range(bisect_left(entries, (prefix,)),
+                                  len(entries)):
+                token, question_id = entries[position]
+                if not token.startswith(prefix):
+                    break
+                if question_id in seen or \
+                        not required <= self._tokens[question_id]:
+                    continue
+                seen.add(question_id)
+                results.append((question_id, self._snippets[question_id]))
+                if len(results) == limit:
+                    break
+        return results
+
+    def _remove(self, question_id):
+        tokens = self._tokens.pop(question_id, None)
+        if tokens is None:
+            return
+        del self._snippets[question_id]
+        for token in tokens:
+            position = bisect_left(self._entries, (token, question_id))
+            del self._entries[position]
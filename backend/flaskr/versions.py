@@ -0,0 +1,134 @@
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request
+
+GLOBAL = 'global'
+
+
+def category_scope(category_id):
+    return 'category:{}'.format(int(category_id))
+
+
+'''
+DataVersions
+    reads the repository's data version counters and turns them into
+    strong ETags. The repository bumps them in the same transaction as
+    each write and reports the new values through on_bump(), so a crash
+    between a write and its bump cannot leave stale ETags behind.
+    Versions are remembered for ``ttl`` seconds, so a conditional GET
+    answered from memory costs no query at all; a write made by another
+    worker shows up once that entry expires. Writes made by this process
+    are visible immediately.
+
+    The in-process caches and indexes only see this process's writes, so
+    the GLOBAL version they were built at is remembered as well. When a
+    read finds the version moved by any other write, the on_change()
+    listeners drop those caches before the new version (and its ETag) is
+    handed out. Another worker's write tells nothing about which rows
+    changed, so the listeners rebuild the indexes in full: an O(N) reload
+    per worker, paid lazily on the next read that needs each index, for
+    every burst of writes made elsewhere.
+'''
+
+
+class DataVersions:
+
+    def __init__(self, repository, ttl=1.0, clock=time.monotonic):
+        self.repository = repository
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._versions = {}
+        # bumped by every bump(), so get() can tell its read went stale
+        self._generation = 0
+        # GLOBAL version the in-process caches are known to match
+        self._observed = None
+        self._listeners = []
+        self.not_modified = 0
+        repository.on_bump(self._bumped)
+
+    def on_change(self, listener):
+        '''Calls ``listener()`` whenever another write moves GLOBAL.'''
+        self._listeners.append(listener)
+
+    def get(self, scope):
+        now = self._clock()
+        with self._lock:
+            entry = self._versions.get(scope)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+            generation = self._generation
+
+        version = self.repository.version(scope)
+        if scope == GLOBAL:
+            self._observe(version)
+        with self._lock:
+            # a bump() that finished meanwhile makes this read outdated
+            if self._generation == generation:
+                self._versions[scope] = (version, now + self.ttl)
+        return version
+
+    def bump(self, scopes):
+        '''Bumps ``scopes`` without a data change, e.g. after a restore.'''
+        self.repository.bump_versions(sorted(set(scopes)))
+
+    def _bumped(self, versions):
+        # called by the repository once a write and its bump are committed
+        with self._lock:
+            self._generation += 1
+            for scope in versions:
+                self._versions.pop(scope, None)
+            if self._observed is not None and \
+                    versions.get(GLOBAL) == self._observed + 1:
+                # no other write came in between, and the writer applies
+                # this one to the caches itself
+                self._observed += 1
+
+    def _observe(self, version):
+        with self._lock:
+            if self._observed is None:
+                self._observed = version
+                return
+            if version <= self._observed:
+                return
+        # drop the caches before anyone is handed the new version
+        for listener in self._listeners:
+            listener()
+        with self._lock:
+            self._observed = max(self._observed, version)
+
+    def etag(self, scope):
+        return '{}-{}'.format(scope, self.get(scope))
+
+    def conditional(self, scope=None):
+        '''
+        Decorator for GET views: answers If-None-Match with 304 before the
+        view runs and tags successful responses with the scope's ETag.
+        ``scope`` maps the view arguments to a scope, GLOBAL by default.
+        '''
+        def decorator(view):
+
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                try:
+                    etag = self.etag(
+                        scope(**kwargs) if scope is not None else GLOBAL)
+                except ValueError:
+                    # malformed arguments, let the view report the error
+                    return view(*args, **kwargs)
+
+                if request.if_none_match.contains(etag):
+                    self.not_modified += 1
+                    response = current_app.response_class(status=304)
+                    response.set_etag(etag)
+                    return response
+
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code == 200:
+                    response.set_etag(etag)
+                return response
+
+            return wrapper
+        return decorator
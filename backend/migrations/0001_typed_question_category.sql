@@ -0,0 +1,40 @@
+-- Types questions.category as an integer foreign key to categories.id and
+-- indexes it for category (and category + difficulty) filtering.
+--
+-- Safe to run on a database restored from trivia.psql, on one whose tables
+-- were created by an older db.create_all() (category stored as varchar),
+-- and more than once.
+--
+--   psql trivia < migrations/0001_typed_question_category.sql
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'questions' AND column_name = 'category')
+            <> 'integer' THEN
+        ALTER TABLE questions ALTER COLUMN category TYPE integer
+            USING NULLIF(trim(category), '')::integer;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                   WHERE conrelid = 'questions'::regclass
+                   AND contype = 'f') THEN
+        -- drop references to categories that no longer exist first
+        UPDATE questions SET category = NULL
+            WHERE category IS NOT NULL
+            AND category NOT IN (SELECT id FROM categories);
+        ALTER TABLE questions ADD CONSTRAINT category
+            FOREIGN KEY (category) REFERENCES categories (id)
+            ON UPDATE CASCADE ON DELETE SET NULL;
+    END IF;
+END
+$$;
+
+CREATE INDEX IF NOT EXISTS ix_questions_category
+    ON questions (category);
+CREATE INDEX IF NOT EXISTS ix_questions_category_difficulty
+    ON questions (category, difficulty);
+
+COMMIT;
@@ -0,0 +1,14 @@
+-- Adds the data_versions table behind the ETags of the read endpoints.
+-- One row per scope: 'global', or 'category:<id>' for one category's
+-- questions. Rows are created on the first write to a scope.
+--
+--   psql trivia < migrations/0002_data_versions.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    scope varchar PRIMARY KEY,
+    version integer NOT NULL DEFAULT 0
+);
+
+COMMIT;
@@ -0,0 +1,16 @@
+-- Adds the question_stats table filled by the play statistics buffer:
+-- per question, how often it was served and answered (correctly).
+--
+--   psql trivia < migrations/0003_question_stats.sql
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS question_stats (
+    question_id integer PRIMARY KEY
+        REFERENCES questions (id) ON UPDATE CASCADE ON DELETE CASCADE,
+    served integer NOT NULL DEFAULT 0,
+    answered integer NOT NULL DEFAULT 0,
+    correct integer NOT NULL DEFAULT 0
+);
+
+COMMIT;
@@ -1,24 +1,95 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, \
+    create_engine
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
 import json
 
 database_name = os.getenv("DB_NAME", "trivia")
-database_path = "postgresql://{}/{}".format('localhost:5432', database_name)
+database_path = os.getenv("DATABASE_URL", "postgresql://{}/{}".format(
+    'localhost:5432', database_name))
+replica_path = os.getenv("DATABASE_REPLICA_URL")
+
+REPLICA_BIND = 'replica'
+
+# engine option -> (environment variable, parser)
+ENGINE_OPTION_VARIABLES = {
+    'pool_size': ('DB_POOL_SIZE', int),
+    'max_overflow': ('DB_MAX_OVERFLOW', int),
+    'pool_timeout': ('DB_POOL_TIMEOUT', float),
+    'pool_recycle': ('DB_POOL_RECYCLE', int),
+    'pool_pre_ping': ('DB_POOL_PRE_PING',
+                      lambda value: value.lower() in ('1', 'true', 'yes')),
+}
+# options only understood by queue pools, which SQLite does not use
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow', 'pool_timeout')
 
 db = SQLAlchemy()
 
+
+def engine_options_from_env(environ=os.environ):
+    options = {}
+    for option, (variable, parse) in ENGINE_OPTION_VARIABLES.items():
+        if environ.get(variable):
+            options[option] = parse(environ[variable])
+    return options
+
+
 '''
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service. Engine options
+    (pool size, overflow, timeout, recycle, pre-ping) are read from the
+    DB_POOL_* environment variables and overridden by ``engine_options``.
+    When ``replica_path`` is given it is bound as a read replica, see
+    read_session().
 '''
 
 
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, engine_options=None,
+             replica_path=replica_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+    options = engine_options_from_env()
+    options.update(engine_options or {})
+    if database_path.startswith('sqlite'):
+        for option in QUEUE_POOL_OPTIONS:
+            options.pop(option, None)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+    if replica_path:
+        app.config["SQLALCHEMY_BINDS"] = {REPLICA_BIND: replica_path}
+
     db.app = app
     db.init_app(app)
+
+    if replica_path:
+        # empty binds: the default per-table binds all point at the primary
+        session = db.create_scoped_session(
+            {"bind": db.get_engine(app, REPLICA_BIND), "binds": {}})
+        app.extensions['trivia_read_session'] = session
+        app.teardown_appcontext(lambda exception: session.remove())
+
+
+'''
+read_session()
+    session for read-only queries: bound to the read replica when the app
+    has one, the primary session otherwise.
+'''
+
+
+def read_session():
+    return current_app.extensions.get('trivia_read_session', db.session)
+
+
+'''
+create_schema()
+    creates any missing tables and indexes. Run once as a deploy step
+    (flask create-schema) rather than on every app start.
+'''
+
+
+def create_schema():
     db.create_all()
 
 
@@ -30,17 +101,23 @@ Question
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (
+        Index('ix_questions_category_difficulty', 'category', 'difficulty'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey(
+        'categories.id', onupdate='CASCADE', ondelete='SET NULL'),
+        index=True)
     difficulty = Column(Integer)
 
     def __init__(self, question, answer, category, difficulty):
         self.question = question
         self.answer = answer
-        self.category = category
+        # older clients send the category id as a string
+        self.category = int(category)
         self.difficulty = difficulty
 
     def insert(self):
@@ -88,3 +165,50 @@ class Category(db.Model):
             'id': self.id,
             'type': self.type
         }
+
+
+'''
+QuestionStat
+    how often a question was served by the quiz endpoints and answered
+    (correctly). Written in batches by the stats buffer, see flaskr/stats.py.
+'''
+
+
+class QuestionStat(db.Model):
+    __tablename__ = 'question_stats'
+
+    question_id = Column(Integer, ForeignKey(
+        'questions.id', onupdate='CASCADE', ondelete='CASCADE'),
+        primary_key=True)
+    served = Column(Integer, nullable=False, default=0)
+    answered = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+
+    def format(self):
+        return {
+            'question_id': self.question_id,
+            'served': self.served,
+            'answered': self.answered,
+            'correct': self.correct
+        }
+
+
+'''
+DataVersion
+    change counter per scope ('global', or 'category:<id>' for one
+    category's questions), bumped by every write. Kept in the database so
+    all worker processes agree on the ETags they hand out.
+'''
+
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_versions'
+
+    scope = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+    def format(self):
+        return {
+            'scope': self.scope,
+            'version': self.version
+        }
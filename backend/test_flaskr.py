@@ -1,10 +1,28 @@
+import asyncio
+import copy
 import os
+import tempfile
+import threading
+import time
 import unittest
 import json
-from flask_sqlalchemy import SQLAlchemy
+
+from flask import Flask, jsonify
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.asgi import create_asgi_app, create_async_engine
+from flaskr.memory_repository import MemoryRepository, read_dump, \
+    write_dump
+from flaskr.quiz_sessions import MemorySessionBackend, QuizSessionStore
+from flaskr.repository import Repository
+from flaskr.response_cache import ResponseCache
+from flaskr.serialization import QuestionRecord, get_encoder, \
+    json_response, orjson, _builtin
+from flaskr.single_flight import SingleFlight
+from flaskr.stats import StatsBuffer, _open_buffers
+from flaskr.testing import ASGIClient
+from flaskr.versions import DataVersions, GLOBAL, category_scope
+from models import db, Question, Category, REPLICA_BIND
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -12,12 +30,13 @@ class TriviaTestCase(unittest.TestCase):
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
         self.database_name = os.getenv("DB_NAME", "trivia_test")
         self.database_path = "postgresql://{}/{}".format(
             'localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
+        self.config = self.storage_config()
+        self.app = create_app(self.config)
+        self.client = self.app.test_client
+        self.repository = self.app.extensions['trivia_repository']
 
         self.new_question = {
             "question": "How many bottles of wine would get an average cow drunk?",
@@ -55,17 +74,14 @@ class TriviaTestCase(unittest.TestCase):
             },
         }
 
-        # binds the app to the current context
-        with self.app.app_context():
-            self.db = SQLAlchemy()
-            self.db.init_app(self.app)
-            # create all tables
-            self.db.create_all()
-
     def tearDown(self):
         """Executed after reach test"""
         pass
 
+    def storage_config(self):
+        """Storage settings of the app under test"""
+        return {"DATABASE_PATH": self.database_path}
+
     """
     TODO
     Write at least one test for each test for successful operation and for expected errors.
@@ -108,17 +124,88 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["success"], False)
         self.assertEqual(data["message"], "unprocessable entity")
 
+    def test_get_questions_with_after_id_cursor(self):
+        """Test that keyset pagination continues from the returned cursor"""
+        first = json.loads(self.client().get('/questions').data)
+        response = self.client().get(
+            '/questions?after_id={}'.format(first["next_after_id"]))
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertTrue(data["questions"])
+        self.assertTrue(all(question["id"] > first["next_after_id"]
+                            for question in data["questions"]))
+        self.assertEqual(data["total_questions"], first["total_questions"])
+
     def test_delete_question(self):
         """Test that endpoint to delete a question works correctly"""
         response = self.client().delete('/questions/9')
         data = json.loads(response.data)
 
-        question = Question.query.filter(Question.id == 9).one_or_none()
+        with self.app.app_context():
+            remaining = self.repository.records([9])
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(data["success"], True)
         self.assertEqual(data["deleted"], 9)
-        self.assertEqual(question, None)
+        self.assertEqual(remaining, [])
+
+    def test_bulk_delete_questions_by_id(self):
+        """Test that bulk delete reports deleted and unknown ids and updates the indexes"""
+        response = self.client().post(
+            '/questions/delete', json={"ids": [9, 10, 10000]})
+        data = json.loads(response.data)
+        quiz = json.loads(self.client().post('/quizzes', json=dict(
+            self.general_quiz, count=50)).data)
+        with self.app.app_context():
+            remaining = self.repository.records([9, 10])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["deleted"], [9, 10])
+        self.assertEqual(data["not_found"], [10000])
+        self.assertEqual(data["total_deleted"], 2)
+        self.assertEqual(remaining, [])
+        self.assertFalse({9, 10} & {question["id"]
+                                    for question in quiz["questions"]})
+
+    def test_bulk_delete_questions_by_filter(self):
+        """Test that bulk delete removes every question matching a filter"""
+        response = self.client().post(
+            '/questions/delete', json={"category": 2, "difficulty": 4})
+        data = json.loads(response.data)
+        with self.app.app_context():
+            remaining = self.repository.count(category=2, difficulty=4)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(data["deleted"])
+        self.assertEqual(data["not_found"], [])
+        self.assertEqual(remaining, 0)
+
+    def test_422_bulk_delete_without_criteria(self):
+        """Test that bulk delete refuses a request without ids or a filter"""
+        response = self.client().post('/questions/delete', json={})
+        data = json.loads(response.data)
+        without_body = self.client().post('/questions/delete')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(without_body.status_code, 422)
+        self.assertEqual(json.loads(without_body.data)["success"], False)
+
+    def test_422_bulk_delete_rejects_values_that_are_not_integers(self):
+        """Test that bulk delete rejects booleans, floats and strings instead of converting them"""
+        bodies = [{"ids": [True]}, {"ids": [1.9]}, {"ids": ["2"]},
+                  {"category": True}, {"category": 2.5},
+                  {"difficulty": "1"}]
+        before = json.loads(self.client().get('/questions').data)
+        responses = [self.client().post('/questions/delete', json=body)
+                     for body in bodies]
+        after = json.loads(self.client().get('/questions').data)
+
+        self.assertEqual([response.status_code for response in responses],
+                         [422] * len(bodies))
+        self.assertEqual(after["total_questions"], before["total_questions"])
 
     def test_422_if_question_does_not_exist(self):
         """Test that end point sends formatted message if question does not exist"""
@@ -154,6 +241,74 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["total_questions"], 0)
         self.assertEqual(data["total_questions"], 0)
 
+    def test_search_question_matches_prefixes_of_every_word(self):
+        """Test that indexed search matches word prefixes and requires every word"""
+        response = self.client().post(
+            '/questions/search', json={"searchTerm": "Heav ORGAN", "page": 1})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["total_questions"], 1)
+        self.assertIn("heaviest organ", data["questions"][0]["question"])
+
+    def test_search_question_substring_mode(self):
+        """Test that substring mode keeps the original ILIKE semantics"""
+        response = self.client().post(
+            '/questions/search',
+            json={"searchTerm": "argest", "mode": "substring"})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertTrue(data["questions"])
+        self.assertEqual(data["total_questions"], len(data["questions"]))
+
+    def test_search_question_substring_mode_matches_wildcards_literally(self):
+        """Test that '%' and '_' in a substring search match themselves, as in the memory backend"""
+        client = self.client()
+        client.post('/questions/create', json=dict(
+            self.new_question, question="Is orange juice 100% fruit?"))
+        client.post('/questions/create', json=dict(
+            self.new_question, question="Who wrote snake_case first?"))
+        results = {term: json.loads(client.post('/questions/search', json={
+            "searchTerm": term, "mode": "substring"}).data)
+            for term in ("0%", "e_c", "%", "_")}
+
+        for term, data in results.items():
+            self.assertTrue(data["questions"])
+            self.assertTrue(all(term in question["question"]
+                                for question in data["questions"]))
+
+    def test_repository_implementations_must_provide_every_method(self):
+        """Test that a repository missing a method cannot be created"""
+        class Incomplete(Repository):
+            def categories(self):
+                return {}
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+    def test_422_search_question_unknown_mode(self):
+        """Test that search rejects a mode it does not know"""
+        response = self.client().post(
+            '/questions/search', json={"searchTerm": "title", "mode": "bogus"})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data["success"], False)
+
+    def test_typeahead_questions(self):
+        """Test that typeahead endpoint completes the last partial word"""
+        response = self.client().get('/questions/typeahead?q=largest%20la')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(len(data["suggestions"]), 1)
+        self.assertEqual(data["suggestions"][0]["snippet"],
+                         "What is the largest lake in Africa?")
+
     def test_create_question(self):
         """Test that endpoint to create a question works correctly"""
         response = self.client().post(
@@ -162,9 +317,7 @@ class TriviaTestCase(unittest.TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(data["success"], True)
-        self.assertTrue(len(data["questions"]))
-        self.assertTrue(isinstance(data["questions"], list))
-        self.assertTrue(data["total_questions"])
+        self.assertNotIn("questions", data)
         self.assertEqual(data["new_question"]["question"],
                          self.new_question["question"])
         self.assertEqual(data["new_question"]["answer"],
@@ -174,6 +327,119 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["new_question"]["category"],
                          self.new_question["category"])
 
+    def test_create_question_with_count(self):
+        """Test that creating a question reports the total only when asked to"""
+        before = json.loads(self.client().get('/questions').data)
+        response = self.client().post(
+            '/questions/create?count=true', json=self.new_question)
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["total_questions"],
+                         before["total_questions"] + 1)
+
+    def test_bulk_create_questions_reports_item_errors(self):
+        """Test that bulk ingest inserts valid questions and reports invalid ones"""
+        response = self.client().post('/questions/bulk', json=[
+            self.new_question, self.new_invalid_question,
+            dict(self.new_question, category=1000), self.new_question])
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["inserted"], 2)
+        self.assertEqual(data["total_items"], 4)
+        self.assertEqual([error["index"] for error in data["errors"]], [1, 2])
+
+    def test_bulk_create_rejects_values_that_are_not_integers(self):
+        """Test that bulk ingest rejects boolean, float and string difficulties and categories"""
+        items = [dict(self.new_question, difficulty=True),
+                 dict(self.new_question, difficulty=2.7),
+                 dict(self.new_question, category=True),
+                 dict(self.new_question, category="1"),
+                 self.new_question]
+        response = self.client().post('/questions/bulk', json=items)
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["inserted"], 1)
+        self.assertEqual([error["index"] for error in data["errors"]],
+                         [0, 1, 2, 3])
+        self.assertEqual(data["errors"][0]["error"],
+                         "'difficulty' must be an integer")
+
+    def test_bulk_create_questions_from_ndjson(self):
+        """Test that bulk ingest accepts an NDJSON stream"""
+        search = {"searchTerm": "average cow"}
+        before = json.loads(self.client().post(
+            '/questions/search', json=search).data)
+        lines = [json.dumps(self.new_question), "not json",
+                 json.dumps(self.new_question)]
+        response = self.client().post(
+            '/questions/bulk', data="\n".join(lines),
+            content_type='application/x-ndjson')
+        data = json.loads(response.data)
+        after = json.loads(self.client().post(
+            '/questions/search', json=search).data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["inserted"], 2)
+        self.assertEqual(data["errors"][0]["index"], 1)
+        self.assertEqual(after["total_questions"],
+                         before["total_questions"] + 2)
+
+    def test_bulk_create_updates_indexes_and_touched_categories(self):
+        """Test that bulk insert indexes the new questions and only re-versions their categories"""
+        client = self.client()
+        art = client.get('/categories/2/questions').headers["ETag"]
+        science = client.get('/categories/1/questions').headers["ETag"]
+        client.post('/questions/search', json={"searchTerm": "title"})
+        response = client.post('/questions/bulk', json=[
+            dict(self.new_question, question="Which zeppelin flew first?")])
+        found = json.loads(client.post(
+            '/questions/search', json={"searchTerm": "zeppelin"}).data)
+
+        self.assertEqual(json.loads(response.data)["inserted"], 1)
+        self.assertEqual(found["total_questions"], 1)
+        self.assertEqual(client.get(
+            '/categories/2/questions',
+            headers={"If-None-Match": art}).status_code, 304)
+        self.assertEqual(client.get(
+            '/categories/1/questions',
+            headers={"If-None-Match": science}).status_code, 200)
+
+    def test_export_questions_ndjson_by_category(self):
+        """Test that export streams one JSON line per question of the filtered category"""
+        expected = json.loads(
+            self.client().get('/categories/2/questions').data)
+        response = self.client().get('/questions/export?category=2')
+        rows = [json.loads(line)
+                for line in response.data.decode().splitlines()]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(sorted(row["id"] for row in rows), sorted(
+            question["id"] for question in expected["questions"]))
+
+    def test_422_export_questions_invalid_filter(self):
+        """Test that export rejects a filter that is not an integer instead of exporting everything"""
+        for query in ('category=abc', 'difficulty=hard'):
+            response = self.client().get('/questions/export?' + query)
+            data = json.loads(response.data)
+
+            self.assertEqual(response.status_code, 422)
+            self.assertEqual(data["success"], False)
+
+    def test_export_questions_cli_csv(self):
+        """Test that the export-questions command writes CSV with a header row"""
+        result = self.app.test_cli_runner().invoke(
+            args=['export-questions', '--format', 'csv', '--difficulty', '1'])
+        lines = result.output.splitlines()
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(lines[0], "id,question,answer,category,difficulty")
+        self.assertTrue(all(line.endswith(",1") for line in lines[1:]))
+
     def test_400_bad_request_on_create_question(self):
         """Test endpoint returns 400 error when creating a new question with incomplete request"""
         response = self.client().post(
@@ -224,6 +490,226 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["question"]["category"],
                          self.specific_quiz["quiz_category"]["id"])
 
+    def test_play_quizzes_accepts_string_category_id(self):
+        """Test that quizzes endpoint still accepts the category id as a string"""
+        quiz = dict(self.specific_quiz, quiz_category={'id': '2', 'type': 'Art'})
+        response = self.client().post('/quizzes', json=quiz)
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["question"]["category"], 2)
+
+    def test_play_quizzes_round_returns_distinct_unseen_questions(self):
+        """Test that a quiz round returns up to count distinct unseen questions"""
+        quiz = dict(self.general_quiz, previous_questions=[5, 9], count=5)
+        response = self.client().post('/quizzes', json=quiz)
+        data = json.loads(response.data)
+        ids = [question["id"] for question in data["questions"]]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(len(set(ids)), 5)
+        self.assertFalse({5, 9} & set(ids))
+        self.assertEqual(data["question"], data["questions"][0])
+
+    def test_play_quizzes_round_filtered_by_difficulty(self):
+        """Test that a quiz round only returns questions of the requested difficulty"""
+        quiz = dict(self.general_quiz, count=50, difficulty=4)
+        response = self.client().post('/quizzes', json=quiz)
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(data["questions"])
+        self.assertTrue(all(question["difficulty"] == 4
+                            for question in data["questions"]))
+
+    def test_play_quizzes_adaptive_mode_follows_recent_answers(self):
+        """Test that adaptive mode starts mid-level and moves with answer streaks"""
+        def play(**fields):
+            return json.loads(self.client().post('/quizzes', json=dict(
+                self.specific_quiz, mode='adaptive', **fields)).data)
+
+        start = play()
+        harder = play(difficulty=2, recent_answers=[False, True, True])
+        easier = play(difficulty=2, recent_answers=[True, False, False])
+        steady = play(difficulty=2, recent_answers=[True, False])
+        exhausted = play(difficulty=3, previous_questions=[17])
+
+        self.assertEqual(start["difficulty"], 2)
+        self.assertEqual(harder["difficulty"], 3)
+        self.assertEqual(harder["question"]["difficulty"], 3)
+        self.assertEqual(easier["difficulty"], 1)
+        self.assertEqual(steady["difficulty"], 2)
+        self.assertEqual(exhausted["difficulty"], 2)
+        self.assertEqual(exhausted["question"]["category"], 2)
+
+    def test_422_play_quizzes_unknown_mode(self):
+        """Test that an unknown quiz mode is rejected"""
+        response = self.client().post('/quizzes', json=dict(
+            self.general_quiz, mode='hardest'))
+
+        self.assertEqual(response.status_code, 422)
+
+    def test_play_quizzes_returns_none_when_category_exhausted(self):
+        """Test that quizzes endpoint returns no question once every question was seen"""
+        seen = json.loads(self.client().get('/categories/2/questions').data)
+        quiz = dict(self.specific_quiz, previous_questions=[
+            question["id"] for question in seen["questions"]])
+
+        response = self.client().post('/quizzes', json=quiz)
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertIsNone(data["question"])
+
+    def test_quiz_session_deals_each_question_once(self):
+        """Test that a quiz session serves every question of the category exactly once"""
+        response = self.client().post('/quizzes/sessions', json={
+            'quiz_category': self.specific_quiz['quiz_category']})
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertTrue(data["total_questions"])
+
+        url = '/quizzes/sessions/{}/next'.format(data["session"])
+        served = []
+        for _ in range(data["total_questions"]):
+            turn = json.loads(self.client().post(url).data)
+            served.append(turn["question"]["id"])
+        last = json.loads(self.client().post(url).data)
+
+        self.assertEqual(len(set(served)), data["total_questions"])
+        self.assertIsNone(last["question"])
+        self.assertEqual(last["remaining"], 0)
+
+    def test_quiz_session_turns_are_atomic_on_a_shared_backend(self):
+        """Test that concurrent turns never deal the same question twice when the backend copies values"""
+        class SharedBackend(MemorySessionBackend):
+            # hands out copies, as a store shared between workers does
+            def get(self, key):
+                return copy.deepcopy(super().get(key))
+
+            def set(self, key, value, ttl):
+                super().set(key, copy.deepcopy(value), ttl)
+
+        store = QuizSessionStore(SharedBackend())
+        token, total = store.start(range(400))
+        dealt = []
+
+        def play():
+            for _ in range(50):
+                dealt.append(store.next(token)[0])
+
+        threads = [threading.Thread(target=play) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(sorted(dealt), list(range(total)))
+        self.assertEqual(store.next(token), (None, 0))
+        with self.assertRaises(TypeError):
+            QuizSessionStore(object())
+
+    def test_404_quiz_session_unknown_token(self):
+        """Test that asking an unknown quiz session for a question returns 404"""
+        response = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(data["message"], "resource not found")
+
+    def test_play_stats_are_buffered_and_flushed_in_batches(self):
+        """Test that served and answered counts reach the stats table on flush"""
+        app = create_app(dict(self.config, STATS_FLUSH_INTERVAL=0))
+        client = app.test_client()
+        quiz = json.loads(client.post('/quizzes', json=dict(
+            self.specific_quiz, count=2)).data)
+        question_id = quiz["questions"][0]["id"]
+        client.post('/questions/{}/answer'.format(question_id),
+                    json={"correct": True})
+        client.post('/questions/{}/answer'.format(question_id),
+                    json={"correct": False})
+        before_flush = json.loads(client.get('/questions/stats').data)
+        written = app.extensions['trivia_play_stats'].flush()
+        stats = json.loads(client.get('/questions/stats?category=2').data)
+        question_stats = {item["question_id"]: item
+                          for item in stats["stats"]}
+
+        self.assertEqual(before_flush["total_questions"], 0)
+        self.assertEqual(written, 2)
+        self.assertEqual(stats["total_questions"], 2)
+        self.assertEqual(question_stats[question_id]["served"], 1)
+        self.assertEqual(question_stats[question_id]["answered"], 2)
+        self.assertEqual(question_stats[question_id]["correct"], 1)
+
+    def test_full_play_stats_buffer_wakes_the_flush_thread(self):
+        """Test that a full stats buffer is flushed by its thread, not by the request, and dropped events are counted"""
+        app = create_app(dict(self.config, STATS_FLUSH_INTERVAL=0,
+                              STATS_BUFFER_MAX_QUESTIONS=2))
+        play_stats = app.extensions['trivia_play_stats']
+        with play_stats._flush_lock:
+            # the flush thread is held up, so the requests must not wait
+            for question_id in (2, 4, 5):
+                play_stats.record(question_id, served=1)
+            stats = play_stats.stats()
+        deadline = time.monotonic() + 5
+        while play_stats.stats()["flushes"] == 0 and \
+                time.monotonic() < deadline:
+            time.sleep(0.01)
+        flushed = play_stats.stats()
+        open_before_close = play_stats in _open_buffers
+        play_stats.close()
+
+        self.assertEqual(stats["pending_questions"], 2)
+        self.assertEqual(stats["dropped_events"], 1)
+        self.assertEqual(flushed["flushes"], 1)
+        self.assertEqual(flushed["pending_questions"], 0)
+        self.assertTrue(open_before_close)
+        self.assertNotIn(play_stats, _open_buffers)
+
+    def test_play_stats_flush_retries_a_failed_batch_once(self):
+        """Test that a flush that fails once is retried before its batch is dropped"""
+        class FlakyStore:
+            def __init__(self, failures):
+                self.failures = failures
+                self.calls = 0
+
+            def add_stats(self, counts):
+                self.calls += 1
+                if self.calls <= self.failures:
+                    raise RuntimeError("stats row inserted concurrently")
+                return len(counts)
+
+        once, always = FlakyStore(1), FlakyStore(2)
+        retried = StatsBuffer(once.add_stats, flush_interval=0)
+        dropped = StatsBuffer(always.add_stats, flush_interval=0)
+        for play_stats in (retried, dropped):
+            play_stats.record(2, served=1)
+            play_stats.flush()
+            play_stats.close()
+
+        self.assertEqual(once.calls, 2)
+        self.assertEqual(retried.stats()["flushed_rows"], 1)
+        self.assertEqual(always.calls, 2)
+        self.assertEqual(dropped.stats()["failed_flushes"], 1)
+
+    def test_422_submit_answer_without_result(self):
+        """Test that the answer endpoint requires a boolean correct field"""
+        response = self.client().post('/questions/5/answer', json={})
+        data = json.loads(response.data)
+        without_body = self.client().post('/questions/5/answer')
+        not_an_object = self.client().post('/questions/5/answer', json=[])
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(data["success"], False)
+        self.assertEqual(without_body.status_code, 422)
+        self.assertEqual(json.loads(without_body.data)["success"], False)
+        self.assertEqual(not_an_object.status_code, 422)
+
     def test_422_quizzes_error(self):
         """Test that returns error when making a request to the quizzes endpoint with invalid parameters."""
         response = self.client().post('/quizzes', json=self.invalid_quiz)
@@ -244,6 +730,435 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data["category"])
         self.assertEqual(data["category"]["type"], "Metaverse")
 
+    def test_category_cache_is_read_through_and_updated_on_write(self):
+        """Test that categories are loaded once and new categories show up without a reload"""
+        self.client().get('/categories')
+        self.client().get('/questions')
+        self.client().post('/categories', json={"type": "Metaverse"})
+        categories = json.loads(self.client().get('/categories').data)
+        response = self.client().get('/cache/stats')
+        data = json.loads(response.data)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Metaverse", categories["categories"].values())
+        self.assertEqual(data["categories"]["misses"], 1)
+        self.assertEqual(data["categories"]["hits"], 2)
+
+    def test_response_cache_serves_repeats_until_a_write(self):
+        """Test that cached routes serve repeats from the cache and are invalidated by writes"""
+        app = create_app(dict(self.config, RESPONSE_CACHE={"get_questions": {
+            "enabled": True, "max_entries": 8, "ttl": 60}}))
+        client = app.test_client()
+
+        first = json.loads(client.get('/questions').data)
+        client.get('/questions')
+        client.post('/questions/create', json=self.new_question)
+        after_write = json.loads(client.get('/questions').data)
+        stats = json.loads(client.get('/cache/stats').data)
+
+        self.assertEqual(after_write["total_questions"],
+                         first["total_questions"] + 1)
+        self.assertEqual(stats["responses"]["get_questions"]["hits"], 1)
+        self.assertEqual(stats["responses"]["get_questions"]["misses"], 2)
+
+    def test_response_cache_skips_a_response_computed_across_a_write(self):
+        """Test that a response whose view overlapped an invalidation is not cached"""
+        app = Flask(__name__)
+        cache = ResponseCache({"counter": {"enabled": True}})
+        calls = []
+
+        @app.route('/counter')
+        @cache.cached
+        def counter():
+            calls.append(1)
+            if len(calls) == 1:
+                # a write lands while the first request is in the view
+                cache.invalidate()
+            return jsonify({"calls": len(calls)})
+
+        client = app.test_client()
+        client.get('/counter')
+        second = client.get('/counter').get_json()
+        third = client.get('/counter').get_json()
+
+        self.assertEqual(second, {"calls": 2})
+        self.assertEqual(third, {"calls": 2})
+
+    def test_metrics_report_latency_and_sql_per_route(self):
+        """Test that /metrics exposes per-route latency and SQL statement histograms"""
+        self.client().get('/questions')
+        response = self.client().get('/metrics')
+        text = response.data.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('trivia_request_duration_seconds_count{method="GET",'
+                      'route="/questions",status="200"} 1', text)
+        self.assertIn('trivia_request_sql_statements_count{method="GET",'
+                      'route="/questions"} 1', text)
+        self.assertIn('trivia_cache_misses_total{cache="categories"} 1', text)
+
+    def test_warmup_on_start_preloads_and_records_timings(self):
+        """Test that warmup preloads the category map and reports startup phases"""
+        app = create_app(dict(self.config, WARMUP_ON_START=True))
+        client = app.test_client()
+        client.get('/categories')
+        stats = json.loads(client.get('/cache/stats').data)
+        metrics = client.get('/metrics').data.decode()
+
+        self.assertEqual(stats["categories"]["misses"], 1)
+        self.assertEqual(stats["categories"]["hits"], 1)
+        self.assertIn('trivia_startup_phase_seconds{phase="warmup"}', metrics)
+        self.assertIn('trivia_startup_phase_seconds{phase="total"}', metrics)
+
+    def test_read_replica_serves_reads_and_primary_takes_writes(self):
+        """Test that read handlers use the replica bind while writes go to the primary"""
+        with tempfile.TemporaryDirectory() as workdir:
+            app = create_app({
+                "DATABASE_PATH": "sqlite:///" + os.path.join(
+                    workdir, "primary.db"),
+                "DATABASE_REPLICA_PATH": "sqlite:///" + os.path.join(
+                    workdir, "replica.db")})
+            with app.app_context():
+                primary = db.get_engine(app)
+                replica = db.get_engine(app, REPLICA_BIND)
+                for engine in (primary, replica):
+                    db.Model.metadata.create_all(engine)
+                    engine.execute(Category.__table__.insert(),
+                                   [{"id": 1, "type": "Science"}])
+                replica.execute(Question.__table__.insert(), [{
+                    "question": "Only on the replica?", "answer": "Yes",
+                    "category": 1, "difficulty": 1}])
+
+            client = app.test_client()
+            listed = json.loads(client.get('/questions').data)
+            created = client.post('/questions/create', json=self.new_question)
+            with app.app_context():
+                primary_questions = [
+                    question.question for question in Question.query.all()]
+
+        self.assertEqual(listed["questions"][0]["question"],
+                         "Only on the replica?")
+        self.assertEqual(created.status_code, 200)
+        self.assertEqual(primary_questions, [self.new_question["question"]])
+
+    def test_conditional_get_answers_304_until_a_write(self):
+        """Test that a matching If-None-Match gets 304 and writes change the ETag"""
+        client = self.client()
+        first = client.get('/categories')
+        etag = first.headers["ETag"]
+        repeat = client.get('/categories', headers={"If-None-Match": etag})
+        client.post('/categories', json={"type": "Music"})
+        changed = client.get('/categories', headers={"If-None-Match": etag})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.data, b"")
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], etag)
+
+    def test_writes_on_another_worker_refresh_cached_reads(self):
+        """Test that a worker drops its cached responses once another worker writes"""
+        config = dict(self.config, DATA_VERSION_TTL=0, RESPONSE_CACHE={
+            "get_questions": {"enabled": True, "ttl": 60}})
+        writer = create_app(config).test_client()
+        reader = create_app(config).test_client()
+        before = reader.get('/questions')
+        writer.post('/questions/create', json=self.new_question)
+        after = reader.get('/questions')
+
+        self.assertEqual(json.loads(after.data)["total_questions"],
+                         json.loads(before.data)["total_questions"] + 1)
+        self.assertNotEqual(after.headers["ETag"], before.headers["ETag"])
+
+    def test_categories_created_on_another_worker_are_seen(self):
+        """Test that a worker reloads its category map after another worker adds a category"""
+        config = dict(self.config, DATA_VERSION_TTL=0)
+        writer = create_app(config).test_client()
+        reader = create_app(config).test_client()
+        reader.get('/categories')
+        category = json.loads(writer.post(
+            '/categories', json={"type": "Metaverse"}).data)["category"]
+        categories = json.loads(reader.get('/categories').data)
+        inserted = json.loads(reader.post('/questions/bulk', json=[dict(
+            self.new_question, category=category["id"])]).data)
+
+        self.assertEqual(categories["categories"][str(category["id"])],
+                         "Metaverse")
+        self.assertEqual(inserted["inserted"], 1)
+
+    def test_search_index_finds_questions_created_on_another_worker(self):
+        """Test that a worker rebuilds its search index after another worker adds a question"""
+        config = dict(self.config, DATA_VERSION_TTL=0)
+        writer = create_app(config).test_client()
+        reader = create_app(config).test_client()
+        term = {"searchTerm": "bottles of wine"}
+        before = json.loads(reader.post('/questions/search', json=term).data)
+        writer.post('/questions/create', json=self.new_question)
+        after = json.loads(reader.post('/questions/search', json=term).data)
+
+        self.assertEqual(before["total_questions"], 0)
+        self.assertEqual(after["total_questions"], 1)
+
+    def test_quiz_serves_questions_created_on_another_worker(self):
+        """Test that a worker rebuilds its quiz pools after another worker adds a question"""
+        config = dict(self.config, DATA_VERSION_TTL=0)
+        writer = create_app(config).test_client()
+        reader = create_app(config).test_client()
+        science = [question["id"] for question in json.loads(
+            reader.get('/categories/1/questions').data)["questions"]]
+        quiz = {"previous_questions": science,
+                "quiz_category": {"id": 1, "type": "Science"}}
+        exhausted = json.loads(reader.post('/quizzes', json=quiz).data)
+        created = json.loads(writer.post(
+            '/questions/create', json=self.new_question).data)
+        after = json.loads(reader.post('/quizzes', json=quiz).data)
+
+        self.assertIsNone(exhausted["question"])
+        self.assertEqual(after["question"]["id"],
+                         created["new_question"]["id"])
+
+    def test_typeahead_suggests_questions_created_on_another_worker(self):
+        """Test that a worker rebuilds its prefix index after another worker adds a question"""
+        config = dict(self.config, DATA_VERSION_TTL=0)
+        writer = create_app(config).test_client()
+        reader = create_app(config).test_client()
+        before = json.loads(reader.get('/questions/typeahead?q=bott').data)
+        writer.post('/questions/create', json=self.new_question)
+        after = json.loads(reader.get('/questions/typeahead?q=bott').data)
+
+        self.assertEqual(before["suggestions"], [])
+        self.assertEqual(len(after["suggestions"]), 1)
+
+    def test_data_versions_do_not_cache_a_read_older_than_a_bump(self):
+        """Test that a version read racing with a bump is not remembered"""
+        repository = MemoryRepository()
+        versions = DataVersions(repository, ttl=60)
+        read_version = repository.version
+
+        def racing_version(scope):
+            version = read_version(scope)
+            repository.version = read_version
+            versions.bump([GLOBAL])
+            return version
+
+        repository.version = racing_version
+
+        self.assertEqual(versions.get(GLOBAL), 0)
+        self.assertEqual(versions.get(GLOBAL), 1)
+
+    def test_repository_writes_bump_versions_with_the_data_change(self):
+        """Test that a repository write moves GLOBAL and its category's version itself, without a separate bump"""
+        bumps = []
+        self.repository.on_bump(bumps.append)
+        scopes = (GLOBAL, category_scope(1))
+        with self.app.app_context():
+            before = [self.repository.version(scope) for scope in scopes]
+            record = self.repository.add_question(
+                "Which moon is largest?", "Ganymede", 1, 2)
+            self.repository.delete_questions([record.id])
+            after = [self.repository.version(scope) for scope in scopes]
+
+        self.assertEqual(after, [version + 2 for version in before])
+        self.assertEqual(bumps, [
+            {GLOBAL: before[0] + 1, category_scope(1): before[1] + 1},
+            {GLOBAL: before[0] + 2, category_scope(1): before[1] + 2}])
+
+    def test_conditional_get_is_versioned_per_category(self):
+        """Test that adding a question only changes its own category's ETag"""
+        client = self.client()
+        science = client.get('/categories/1/questions').headers["ETag"]
+        art = client.get('/categories/2/questions').headers["ETag"]
+        client.post('/questions/create', json=self.new_question)
+
+        self.assertEqual(client.get(
+            '/categories/1/questions',
+            headers={"If-None-Match": science}).status_code, 200)
+        self.assertEqual(client.get(
+            '/categories/2/questions',
+            headers={"If-None-Match": art}).status_code, 304)
+
+    def test_snapshot_serves_reads_until_the_bank_changes(self):
+        """Test that a mapped snapshot matches the database and is dropped once stale"""
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "questions.snapshot")
+            app = create_app(dict(self.config, QUESTION_SNAPSHOT_PATH=path,
+                                  QUESTION_SNAPSHOT_CHECK_INTERVAL=0))
+            client = app.test_client()
+            from_database = client.get('/questions?page=2').data
+
+            result = app.test_cli_runner().invoke(args=['build-snapshot'])
+            from_snapshot = client.get('/questions?page=2').data
+            categories = json.loads(client.get('/categories').data)
+            quiz = json.loads(client.post('/quizzes', json=dict(
+                self.specific_quiz, count=50, difficulty=1)).data)
+            client.post('/questions/create', json=self.new_question)
+            after_write = json.loads(client.get('/questions').data)
+            metrics = client.get('/metrics').data.decode()
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(from_snapshot, from_database)
+        self.assertTrue(categories["categories"])
+        self.assertTrue(quiz["questions"])
+        self.assertTrue(all(question["category"] == 2 and
+                            question["difficulty"] == 1
+                            for question in quiz["questions"]))
+        self.assertEqual(after_write["total_questions"],
+                         json.loads(from_database)["total_questions"] + 1)
+        self.assertIn('trivia_snapshot_swaps_total 1', metrics)
+
+    def test_single_flight_coalesces_identical_concurrent_requests(self):
+        """Test that concurrent identical requests share one execution of the view"""
+        app = Flask(__name__)
+        flight = SingleFlight(max_wait=5)
+        entered, release = threading.Event(), threading.Event()
+        calls = []
+
+        @app.route('/slow')
+        @flight.coalesced
+        def slow():
+            calls.append(1)
+            entered.set()
+            release.wait(5)
+            return jsonify({"calls": len(calls)})
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            app.test_client().get('/slow').get_json())) for _ in range(5)]
+        threads[0].start()
+        entered.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while flight.stats()["slow"]["waiting"] < 4 and \
+                time.monotonic() < deadline:
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        stats = flight.stats()["slow"]
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"calls": 1}] * 5)
+        self.assertEqual(stats["executed"], 1)
+        self.assertEqual(stats["coalesced"], 4)
+
+    @unittest.skipIf(create_async_engine is None, "needs SQLAlchemy 1.4+")
+    def test_async_read_api_matches_sync_responses(self):
+        """Test that the ASGI read API answers with the same bytes as the Flask app"""
+        requests = [
+            ('GET', '/categories', None),
+            ('GET', '/questions?page=2', None),
+            ('GET', '/questions?page=2&page=3', None),
+            ('GET', '/questions?after_id=5', None),
+            ('GET', '/categories/2/questions', None),
+            ('POST', '/questions/search', {"searchTerm": "largest"}),
+            ('POST', '/questions/search',
+             {"searchTerm": "argest", "mode": "substring"}),
+            ('POST', '/questions/search',
+             {"searchTerm": "title", "mode": "bogus"}),
+            ('POST', '/questions/search',
+             {"searchTerm": "_", "mode": "substring"}),
+            ('POST', '/questions/search', {"searchTerm": "title", "page": "2"}),
+            ('POST', '/quizzes',
+             {"previous_questions": 5, "quiz_category": {"id": 0}}),
+            ('GET', '/questions?page=10000', None),
+            ('POST', '/quizzes', self.invalid_quiz),
+        ]
+        client = self.client()
+        expected = [(response.status_code, response.data) for response in [
+            client.get(path) if method == 'GET' else
+            client.post(path, json=body)
+            for method, path, body in requests]]
+
+        async def run():
+            app = create_asgi_app({"DATABASE_PATH": self.database_path})
+            try:
+                await app.startup()
+            except ImportError as error:
+                self.skipTest("no async driver installed: {}".format(error))
+            asgi = ASGIClient(app)
+            try:
+                responses = [await asgi.request(method, path, body)
+                             for method, path, body in requests]
+                quiz = await asgi.post('/quizzes', json=dict(
+                    self.specific_quiz, count=50))
+            finally:
+                await app.shutdown()
+            return responses, quiz
+
+        responses, quiz = asyncio.run(run())
+        with self.app.app_context():
+            art = {question.id for question in
+                   self.repository.records_in_category(2)}
+
+        self.assertEqual([(response.status_code, response.data)
+                          for response in responses], expected)
+        self.assertEqual({question["id"] for question in
+                          json.loads(quiz.data)["questions"]}, art)
+
+    @unittest.skipIf(create_async_engine is None, "needs SQLAlchemy 1.4+")
+    def test_async_read_api_answers_cors_preflight(self):
+        """Test that the ASGI read API answers an OPTIONS preflight without touching the database"""
+        async def run():
+            asgi = ASGIClient(
+                create_asgi_app({"DATABASE_PATH": self.database_path}))
+            return (await asgi.options('/questions/search', headers=[
+                ("Access-Control-Request-Method", "POST"),
+                ("Access-Control-Request-Headers", "content-type")]),
+                await asgi.options('/nowhere'))
+
+        preflight, unknown = asyncio.run(run())
+
+        self.assertEqual(preflight.status_code, 200)
+        self.assertEqual(preflight.data, b'')
+        self.assertEqual(
+            preflight.headers["access-control-allow-origin"], "*")
+        self.assertEqual(
+            preflight.headers["access-control-allow-headers"], "content-type")
+        self.assertIn("POST", preflight.headers["allow"])
+        self.assertEqual(unknown.status_code, 404)
+
+    @unittest.skipIf(create_async_engine is None, "needs SQLAlchemy 1.4+")
+    def test_async_read_api_records_served_quiz_questions(self):
+        """Test that quiz questions served by the ASGI read API reach the stats table"""
+        async def run():
+            app = create_asgi_app({"DATABASE_PATH": self.database_path,
+                                   "STATS_FLUSH_INTERVAL": 0})
+            try:
+                await app.startup()
+            except ImportError as error:
+                self.skipTest("no async driver installed: {}".format(error))
+            try:
+                return await ASGIClient(app).post('/quizzes', json=dict(
+                    self.specific_quiz, count=2))
+            finally:
+                await app.shutdown()
+
+        quiz = json.loads(asyncio.run(run()).data)
+        stats = json.loads(
+            self.client().get('/questions/stats?category=2').data)
+
+        self.assertEqual(
+            {item["question_id"]: item["served"] for item in stats["stats"]},
+            {question["id"]: 1 for question in quiz["questions"]})
+
+    def test_json_encoders_match_jsonify_byte_for_byte(self):
+        """Test that the fast list serialization produces the same bytes as jsonify"""
+        record = QuestionRecord(
+            answer="Ça va – \U0001F600", category=2, difficulty=3,
+            id=7, question="Tab\there, quote \" and \x7f?")
+        payload = {"success": True, "questions": [record],
+                   "question": record, "total_questions": 1,
+                   "categories": {10: "Art", 2: "Sports", 1: "Science"}}
+
+        with self.app.app_context():
+            expected = jsonify(_builtin(payload)).get_data()
+            for name in ('stdlib', 'orjson'):
+                if name == 'orjson' and orjson is None:
+                    continue
+                self.app.extensions['trivia_json_encoder'] = get_encoder(name)
+                self.assertEqual(json_response(payload).get_data(), expected)
+
     def test_422_create_category_error(self):
         """Test that returns error when making a post request to the categories endpoint with invalid parameters."""
         response = self.client().post('/categories')
@@ -263,6 +1178,62 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data["message"], "resource not found")
 
 
+class InMemoryTriviaTestCase(TriviaTestCase):
+    """Runs the trivia scenarios against the in-memory storage backend"""
+
+    def storage_config(self):
+        return {"STORAGE_BACKEND": "memory",
+                "STORAGE_DUMP_PATH": os.path.join(os.path.dirname(
+                    os.path.abspath(__file__)), "trivia.psql")}
+
+    @unittest.skip("read replicas are a database feature")
+    def test_read_replica_serves_reads_and_primary_takes_writes(self):
+        pass
+
+    @unittest.skip("memory backends are not shared between workers")
+    def test_writes_on_another_worker_refresh_cached_reads(self):
+        pass
+
+    @unittest.skip("memory backends are not shared between workers")
+    def test_categories_created_on_another_worker_are_seen(self):
+        pass
+
+    @unittest.skip("memory backends are not shared between workers")
+    def test_search_index_finds_questions_created_on_another_worker(self):
+        pass
+
+    @unittest.skip("memory backends are not shared between workers")
+    def test_quiz_serves_questions_created_on_another_worker(self):
+        pass
+
+    @unittest.skip("memory backends are not shared between workers")
+    def test_typeahead_suggests_questions_created_on_another_worker(self):
+        pass
+
+    @unittest.skip("the async read API reads from the database")
+    def test_async_read_api_matches_sync_responses(self):
+        pass
+
+    @unittest.skip("the async read API reads from the database")
+    def test_async_read_api_records_served_quiz_questions(self):
+        pass
+
+    def test_dump_round_trip_keeps_escaped_text_and_nulls(self):
+        """Test that dumps written by write_dump read back unchanged"""
+        tables = {
+            "categories": [{"id": 1, "type": "Science"}],
+            "questions": [{
+                "id": 7, "question": "Tab\there, back\\slash,\nnew line?",
+                "answer": None, "difficulty": 2, "category": 1}]
+        }
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "trivia.dump")
+            write_dump(path, tables)
+            loaded = read_dump(path)
+
+        self.assertEqual(loaded, tables)
+
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
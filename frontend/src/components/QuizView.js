@@ -15,6 +15,7 @@ class QuizView extends Component {
         categories: {},
         numCorrect: 0,
         currentQuestion: {},
+        round: [],
         guess: '',
         forceEnd: false
     }
@@ -34,55 +35,86 @@ class QuizView extends Component {
   }
 
   selectCategory = ({type, id=0}) => {
-    this.setState({quizCategory: {type, id}}, this.getNextQuestion)
+    this.setState({quizCategory: {type, id}}, this.getRound)
   }
 
   handleChange = (event) => {
     this.setState({[event.target.name]: event.target.value})
   }
 
-  getNextQuestion = () => {
-    const previousQuestions = [...this.state.previousQuestions]
-    if(this.state.currentQuestion.id) { previousQuestions.push(this.state.currentQuestion.id) }
-
+  // fetch the whole round in one request, then play it locally
+  getRound = () => {
     $.ajax({
-      url: '/quizzes', //TODO: update request URL
+      url: '/quizzes',
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
       data: JSON.stringify({
-        previous_questions: previousQuestions,
-        quiz_category: this.state.quizCategory
+        previous_questions: this.state.previousQuestions,
+        quiz_category: this.state.quizCategory,
+        count: questionsPerPlay
       }),
       xhrFields: {
         withCredentials: true
       },
       crossDomain: true,
       success: (result) => {
+        const [first, ...rest] = result.questions
         this.setState({
           showAnswer: false,
-          previousQuestions: previousQuestions,
-          currentQuestion: result.question,
+          currentQuestion: first || {},
+          round: rest,
           guess: '',
-          forceEnd: result.question ? false : true
+          forceEnd: first ? false : true
         })
       },
       error: (error) => {
-        alert('Unable to load question. Please try your request again')
+        alert('Unable to load questions. Please try your request again')
       }
     })
   }
 
+  getNextQuestion = () => {
+    const previousQuestions = [...this.state.previousQuestions]
+    if(this.state.currentQuestion.id) { previousQuestions.push(this.state.currentQuestion.id) }
+
+    const [next, ...rest] = this.state.round
+    this.setState({
+      showAnswer: false,
+      previousQuestions: previousQuestions,
+      currentQuestion: next || {},
+      round: rest,
+      guess: '',
+      forceEnd: next ? false : true
+    })
+  }
+
   submitGuess = (event) => {
     event.preventDefault();
     const formatGuess = this.state.guess.replace(/[.,\/#!$%\^&\*;:{}=\-_`~()]/g,"").toLowerCase()
     const evaluate =  this.evaluateAnswer()
+    this.submitAnswer(evaluate)
     this.setState({
       numCorrect: !evaluate ? this.state.numCorrect : this.state.numCorrect + 1,
       showAnswer: true,
     })
   }
 
+  submitAnswer = (correct) => {
+    // play statistics only; the game does not wait for the result
+    $.ajax({
+      url: `/questions/${this.state.currentQuestion.id}/answer`,
+      type: "POST",
+      dataType: 'json',
+      contentType: 'application/json',
+      data: JSON.stringify({correct}),
+      xhrFields: {
+        withCredentials: true
+      },
+      crossDomain: true,
+    })
+  }
+
   restartGame = () => {
     this.setState({
       quizCategory: null,
@@ -90,6 +122,7 @@ class QuizView extends Component {
       showAnswer: false,
       numCorrect: 0,
       currentQuestion: {},
+      round: [],
       guess: '',
       forceEnd: false
     })
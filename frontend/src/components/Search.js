@@ -1,8 +1,13 @@
 import React, { Component } from 'react'
+import $ from 'jquery';
+
+// wait this long after the last keystroke before asking for suggestions
+const TYPEAHEAD_DELAY_MS = 150
 
 class Search extends Component {
   state = {
     query: '',
+    suggestions: [],
   }
 
   getInfo = (event) => {
@@ -10,12 +15,53 @@ class Search extends Component {
     this.props.submitSearch(this.state.query)
   }
 
-  handleInputChange = () => {
-    this.setState({
-      query: this.search.value
+  componentWillUnmount() {
+    this.cancelSuggestions()
+  }
+
+  cancelSuggestions = () => {
+    clearTimeout(this.typeaheadTimer)
+    if (this.typeaheadRequest) {
+      this.typeaheadRequest.abort()
+      this.typeaheadRequest = null
+    }
+  }
+
+  getSuggestions = (query) => {
+    this.cancelSuggestions()
+    if (!query.trim()) {
+      this.setState({ suggestions: [] })
+      return;
+    }
+
+    this.typeaheadTimer = setTimeout(
+      () => this.fetchSuggestions(query), TYPEAHEAD_DELAY_MS)
+  }
+
+  fetchSuggestions = (query) => {
+    this.typeaheadRequest = $.ajax({
+      url: `/questions/typeahead?q=${encodeURIComponent(query)}`,
+      type: "GET",
+      success: (result) => {
+        // ignore answers to keystrokes the user has already typed past
+        if (this.state.query === query) {
+          this.setState({ suggestions: result.suggestions })
+        }
+      },
+      error: (xhr, status) => {
+        // an aborted request was superseded by a newer keystroke
+        if (status !== 'abort') {
+          this.setState({ suggestions: [] })
+        }
+      }
     })
   }
 
+  handleInputChange = () => {
+    const query = this.search.value
+    this.setState({ query }, () => this.getSuggestions(query))
+  }
+
   render() {
     return (
       <form onSubmit={this.getInfo}>
@@ -23,7 +69,13 @@ class Search extends Component {
           placeholder="Search questions..."
           ref={input => this.search = input}
           onChange={this.handleInputChange}
+          list="search-suggestions"
         />
+        <datalist id="search-suggestions">
+          {this.state.suggestions.map(suggestion => (
+            <option key={suggestion.id} value={suggestion.snippet} />
+          ))}
+        </datalist>
         <input type="submit" value="Submit" className="button"/>
       </form>
     )